@@ -0,0 +1,255 @@
+"""
+Basin of attraction of the controller: which initial angles and angular
+velocities it recovers, for a given norm and defuzzification method.
+
+The grid of initial states is simulated in tiles of cells, each tile as one
+batch of pendulums in a worker process. Finished tiles are cached on disk,
+keyed by the cells they hold, so that refining or extending a grid only
+simulates the cells that were never simulated with the same settings.
+"""
+# Module level imports
+from __future__ import print_function
+import argparse
+import hashlib
+import multiprocessing
+import os
+from timeit import default_timer as clock
+from numpy import abs, array, empty, full, inf, isfinite, linspace, load, meshgrid, pi, save, \
+    savez, uint8, where, zeros
+
+# Project level imports
+from control import NORMS, DEFUZZIFIERS
+from ip import CACHE_DIR, BatchPendulum, controller_key, load_controller
+from metrics import FALL_ANGLE, SETTLE_ANGLE
+
+# One simulated cell: the initial state, whether the pendulum was recovered
+# and its settling time, as in ``metrics.settling_time``
+CELL_DTYPE = [('O', float), ('w', float), ('recovered', bool), ('settling_time', float)]
+
+# Controller of each worker process, loaded once by ``_init_worker``
+_controller = None
+
+
+def _init_worker():
+    global _controller
+    _controller = load_controller()
+
+
+def simulate(controller, O, w, steps, dt=0.01, l=0.5, m=0.1, mc=0.5):
+    """
+    Simulates a batch of pendulums from the given initial angles and angular
+    velocities, with the cart at rest at the origin.
+
+    :Parameters:
+      controller
+        A batched controller, such as ``control.ArrayController`` or
+        ``PendulumController.evaluate``;
+      O, w
+        Arrays of initial angles and angular velocities;
+      steps
+        Number of steps simulated;
+      dt, l, m, mc
+        Parameters of the pendulums, as in ``ip.BatchPendulum``.
+
+    :Returns:
+      A tuple of arrays ``(recovered, settling_time)``. A pendulum is
+      recovered if its angle never goes beyond ``metrics.FALL_ANGLE`` and
+      settles before the end.
+    """
+    ip = BatchPendulum(len(O), l, m, mc, dt)
+    ip.set_state(O, w)
+    fallen = zeros(len(O), dtype=bool)
+    last_out = full(len(O), -1)  # Last step outside of the settled band
+    for i in range(steps):
+        angle = abs(ip.O)
+        last_out[angle > SETTLE_ANGLE] = i
+        fallen |= angle > FALL_ANGLE
+        ip.step(controller)
+    settling_time = where(last_out < 0, 0., (last_out + 1) * dt)
+    settling_time[last_out == steps - 1] = inf
+    return ~fallen & isfinite(settling_time), settling_time
+
+
+def _simulate_tile(args):
+    """
+    Simulates one tile in a worker process.
+    """
+    norm, defuzzy, O, w, steps, dt, l, m, mc = args
+    _controller.set_norm(NORMS[norm])
+    _controller.set_defuzzy(DEFUZZIFIERS[defuzzy])
+    tile = empty(len(O), dtype=CELL_DTYPE)
+    tile['O'] = O
+    tile['w'] = w
+    tile['recovered'], tile['settling_time'] = simulate(_controller.evaluate, O, w, steps, dt, l, m, mc)
+    return tile
+
+
+def cell_key(O, w):
+    """
+    Key of a cell in the cache. Coordinates are rounded, so that the same
+    point computed by different grids is found.
+    """
+    return int(round(O * 1e9)), int(round(w * 1e9))
+
+
+def settings_key(norm, defuzzy, duration, dt, l, m, mc):
+    """
+    Hash of everything that the result of a cell depends on, besides its
+    initial state.
+    """
+    settings = repr((norm, defuzzy, float(duration), float(dt), float(l), float(m), float(mc),
+                     SETTLE_ANGLE, FALL_ANGLE))
+    return hashlib.sha1((settings + controller_key()).encode('utf-8')).hexdigest()
+
+
+def load_tiles(directory):
+    """
+    Returns the cells of every tile cached in a directory, by ``cell_key``.
+    """
+    cells = {}
+    if not os.path.isdir(directory):
+        return cells
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('tile-') and name.endswith('.npy'):
+            for cell in load(os.path.join(directory, name)):
+                cells[cell_key(cell['O'], cell['w'])] = cell
+    return cells
+
+
+def save_tile(directory, tile):
+    """
+    Caches a tile, named after the cells it holds.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    name = os.path.join(directory, 'tile-%s.npy' % hashlib.sha1(tile['O'].tobytes() + tile['w'].tobytes()).hexdigest()[:16])
+    # Written under a temporary name and renamed, so that a tile is never
+    # read partially
+    temp = '%s.%d.npy' % (name[:-4], os.getpid())
+    save(temp, tile)
+    os.rename(temp, name)
+
+
+def basin(O, w, norm='min', defuzzy='exact-cog', duration=10., dt=0.01, l=0.5, m=0.1, mc=0.5,
+          tile=1024, processes=None, cache_dir=CACHE_DIR):
+    """
+    Computes the basin of attraction over a grid of initial states.
+
+    :Parameters:
+      O, w
+        Initial angles and angular velocities along each axis of the grid;
+      norm, defuzzy
+        Keys of ``NORMS`` and ``DEFUZZIFIERS``. Methods not supported by
+        ``control.ArrayController`` go through pyfuzzy one cell at a time,
+        which is much slower;
+      duration
+        Simulated time of each cell, in seconds;
+      dt, l, m, mc
+        Parameters of the pendulum;
+      tile
+        Number of cells simulated together;
+      processes
+        Number of worker processes. Defaults to the number of cores;
+      cache_dir
+        Directory under which finished tiles are cached, or None.
+
+    :Returns:
+      A tuple ``(recovered, settling_time, computed)``, where the first two
+      are ``(len(O), len(w))`` arrays and ``computed`` is the number of cells
+      that were simulated, instead of found in the cache.
+    """
+    directory = None
+    cells = {}
+    if cache_dir is not None:
+        directory = os.path.join(cache_dir, 'basin-%s' % settings_key(norm, defuzzy, duration, dt, l, m, mc))
+        cells = load_tiles(directory)
+
+    OO, ww = meshgrid(array(O, dtype=float), array(w, dtype=float), indexing='ij')
+    keys = [cell_key(a, b) for a, b in zip(OO.ravel(), ww.ravel())]
+    missing = array([i for i, key in enumerate(keys) if key not in cells], dtype=int)
+    if len(missing) > 0:
+        steps = int(round(duration / dt))
+        Om = OO.ravel()[missing]
+        wm = ww.ravel()[missing]
+        tasks = [(norm, defuzzy, Om[i:i + tile], wm[i:i + tile], steps, dt, l, m, mc)
+                 for i in range(0, len(missing), tile)]
+        processes = processes or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(min(processes, len(tasks)), _init_worker)
+        try:
+            for result in pool.imap_unordered(_simulate_tile, tasks):
+                if directory is not None:
+                    save_tile(directory, result)
+                for cell in result:
+                    cells[cell_key(cell['O'], cell['w'])] = cell
+        finally:
+            pool.close()
+            pool.join()
+
+    recovered = array([cells[key]['recovered'] for key in keys], dtype=bool).reshape(OO.shape)
+    settling_time = array([cells[key]['settling_time'] for key in keys], dtype=float).reshape(OO.shape)
+    return recovered, settling_time, len(missing)
+
+
+def heatmap(recovered, settling_time):
+    """
+    Renders a basin of attraction as an RGB image, with the angle along the
+    horizontal axis and the angular velocity growing upwards. Recovered cells
+    go from green, settling at once, to yellow, settling last; the others are
+    dark red.
+
+    :Returns:
+      A ``(len(w), len(O), 3)`` array of bytes.
+    """
+    times = settling_time[recovered]
+    longest = times.max() if len(times) > 0 and times.max() > 0 else 1.
+    s = where(recovered, settling_time / longest, 0.)
+    image = empty(recovered.shape + (3,), dtype=uint8)
+    image[..., 0] = where(recovered, 255 * s, 128)
+    image[..., 1] = where(recovered, 200, 0)
+    image[..., 2] = 0
+    return image.transpose(1, 0, 2)[::-1]
+
+
+def write_ppm(path, image):
+    """
+    Writes an RGB image to a binary PPM file, readable by most image viewers.
+    """
+    with open(path, 'wb') as f:
+        f.write(('P6\n%d %d\n255\n' % (image.shape[1], image.shape[0])).encode('ascii'))
+        f.write(image.tobytes())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maps the initial states recovered by the controller.")
+    parser.add_argument('--norm', nargs='+', choices=sorted(NORMS), default=['min'])
+    parser.add_argument('--defuzzy', nargs='+', choices=sorted(DEFUZZIFIERS), default=['exact-cog'])
+    parser.add_argument('--theta', nargs=3, type=float, default=[-90., 90., 181],
+                        metavar=('START', 'STOP', 'N'), help="initial angles, in degrees")
+    parser.add_argument('--omega', nargs=3, type=float, default=[-10., 10., 101],
+                        metavar=('START', 'STOP', 'N'), help="initial angular velocities, in rad/s")
+    parser.add_argument('--duration', type=float, default=10.)
+    parser.add_argument('--dt', type=float, default=0.01)
+    parser.add_argument('--tile', type=int, default=1024, help="cells simulated together")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--no-cache', action='store_true', help="simulate every cell")
+    parser.add_argument('--output', default='basin', help="prefix of the .npz and .ppm files written")
+    args = parser.parse_args(argv)
+
+    O = linspace(args.theta[0], args.theta[1], int(args.theta[2])) * pi / 180.
+    w = linspace(args.omega[0], args.omega[1], int(args.omega[2]))
+    for norm in args.norm:
+        for defuzzy in args.defuzzy:
+            t0 = clock()
+            recovered, settling_time, computed = basin(O, w, norm, defuzzy, args.duration, args.dt,
+                                                       tile=args.tile, processes=args.processes,
+                                                       cache_dir=None if args.no_cache else CACHE_DIR)
+            elapsed = clock() - t0
+            prefix = '%s-%s-%s' % (args.output, norm, defuzzy)
+            savez(prefix + '.npz', O=O, w=w, recovered=recovered, settling_time=settling_time)
+            write_ppm(prefix + '.ppm', heatmap(recovered, settling_time))
+            print("%s, %s: %.1f%% recovered, %d of %d cells simulated in %.3f s" %
+                  (norm, defuzzy, 100. * recovered.mean(), computed, recovered.size, elapsed))
+
+
+if __name__ == "__main__":
+    main()
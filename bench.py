@@ -0,0 +1,300 @@
+"""
+Benchmarks of the hot paths: the physics step, the controller with every norm
+and defuzzification method, the batched engine with and without rule pruning,
+the controller build, the simulation step of the worker and, when Qt can be
+used, the pendulum view and the plots.
+
+Each benchmark is timed over several repeats, and the rate of each repeat is
+kept, so the results carry their variance. They are written as JSON and can
+be compared with an earlier file, flagging the benchmarks that became slower
+by more than a threshold and more than the noise of both runs.
+"""
+# Module level imports
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from timeit import default_timer as clock
+from numpy import pi
+from numpy.random import RandomState
+
+# Project level imports
+# The control module, which needs pyfuzzy, and Qt are imported by the groups
+# of benchmarks that use them
+from integrators import INTEGRATORS
+from ip import InvertedPendulum, add_cart_table, create_controller, load_controller
+
+# Inputs of the controller benchmarks, the same on every run
+_random = RandomState(0)
+STATES = list(zip(_random.uniform(-3 * pi / 8, 3 * pi / 8, 64), _random.uniform(-3 * pi, 3 * pi, 64)))
+
+
+def cycle(f, values):
+    """
+    Returns a function of no arguments that calls ``f`` with each of
+    ``values`` in turn.
+    """
+    state = [0]
+    n = len(values)
+
+    def call():
+        i = state[0]
+        state[0] = (i + 1) % n
+        return f(*values[i])
+    return call
+
+
+def physics_cases():
+    """
+    Each group of benchmarks returns a list of ``(name, make)``, where
+    ``make`` builds the fixtures of the benchmark and returns the function to
+    be timed. Only the benchmarks that are run get built.
+    """
+    def make(integrator=None):
+        ip = InvertedPendulum() if integrator is None else InvertedPendulum(integrator=integrator)
+        ip.set_state(pi / 8, 0., 0., 0.)
+        return cycle(ip.apply, [(F,) for F in (-5., 0., 5.)])
+
+    cases = [('ip.apply', make)]
+    for name in sorted(INTEGRATORS):
+        cases.append(('ip.apply[%s]' % name, lambda name=name: make(name)))
+    return cases
+
+
+def controller_cases():
+    from control import ArrayController, DEFUZZIFIERS, NORMS
+
+    random = RandomState(1)
+    batch = {'O': random.uniform(-3 * pi / 8, 3 * pi / 8, 4096), 'w': random.uniform(-3 * pi, 3 * pi, 4096),
+             'x': random.uniform(-10., 10., 4096), 'v': random.uniform(-6., 6., 4096)}
+
+    def controller(norm, defuzzy):
+        pc = load_controller()
+        pc.set_norm(NORMS[norm])
+        pc.set_defuzzy(DEFUZZIFIERS[defuzzy])
+        return cycle(lambda O, w: pc({'O': O, 'w': w}, {'F': 0.}), STATES)
+
+    def engine():
+        pc = load_controller()
+        pc.set_defuzzy(DEFUZZIFIERS['exact-cog'])
+        pc.set_engine(True)
+        return cycle(lambda O, w: pc({'O': O, 'w': w}, {'F': 0.}), STATES)
+
+    def cart():
+        controller = create_controller()
+        add_cart_table(controller)
+        return controller
+
+    def engine_batch(controller, norm, pruned):
+        engine = ArrayController.from_controller(controller)
+        if norm is not None:
+            engine.set_norm(NORMS[norm])
+        engine.set_defuzzy(DEFUZZIFIERS['exact-cog'])
+        engine.pruned = engine.pruned and pruned
+        return lambda: engine(batch)
+
+    cases = []
+    for norm in sorted(NORMS):
+        for defuzzy in sorted(DEFUZZIFIERS):
+            cases.append(('controller[%s,%s]' % (norm, defuzzy),
+                          lambda norm=norm, defuzzy=defuzzy: controller(norm, defuzzy)))
+    cases.append(('controller.engine', engine))
+    for pruned in (True, False):
+        cases.append(('engine.batch[%s]' % ('pruned' if pruned else 'dense'),
+                      lambda pruned=pruned: engine_batch(load_controller(), None, pruned)))
+    # The same with the rules of the cart, a second table over other inputs
+    for norm in sorted(NORMS):
+        for pruned in (True, False):
+            cases.append(('engine.batch.cart[%s,%s]' % (norm, 'pruned' if pruned else 'dense'),
+                          lambda norm=norm, pruned=pruned: engine_batch(cart(), norm, pruned)))
+    cases.append(('create_controller', lambda: create_controller))
+    cases.append(('load_controller', lambda: load_controller))
+    return cases
+
+
+def worker_cases():
+    def make():
+        # Imported here, since worker is only needed by this benchmark
+        from worker import SimulationWorker
+
+        worker = SimulationWorker(InvertedPendulum(), load_controller())
+        worker.ip.set_state(pi / 8, 0., 0., 0.)
+        return lambda: worker.advance(1)
+
+    return [('worker.advance', make)]
+
+
+def qt_cases():
+    """
+    Benchmarks of the widgets. They are drawn offscreen, without being shown,
+    but Qt still needs a display (Xvfb is enough).
+    """
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        return []
+    applications = []  # Keeps the application alive while the widgets are timed
+
+    def application():
+        from PyQt4.QtGui import QApplication
+
+        if not applications:
+            applications.append(QApplication.instance() or QApplication([]))
+        return applications[0]
+
+    def view():
+        from qtip import PendulumView
+
+        application()
+        view = PendulumView()
+        view.resize(400, 300)
+        return cycle(view.set_state, [(O, w, 0.1, 0., 10.) for O, w in STATES])
+
+    def plots():
+        from numpy import linspace, sin
+        from plot import PlotWindow
+
+        application()
+        plots = PlotWindow(5)
+        plots.resize(600, 300)
+        plots.max_fps = None  # Every call replots
+        x = linspace(0., 2.5, 250)
+        data = [(x, sin(x + i)) for i in range(5)]
+        return lambda: plots.set_multi_data(data)
+
+    return [('PendulumView.set_state', view),
+            ('PlotWindow.set_multi_data', plots)]
+
+
+# Groups of benchmarks, by name
+GROUPS = [('physics', physics_cases), ('controller', controller_cases),
+          ('worker', worker_cases), ('qt', qt_cases)]
+
+
+def measure(f, repeat=5, min_time=0.1):
+    """
+    Times a function.
+
+    :Parameters:
+      f
+        Function of no arguments;
+      repeat
+        Number of timed repeats;
+      min_time
+        Minimum duration of each repeat, in seconds. The number of calls per
+        repeat is doubled until it is reached.
+
+    :Returns:
+      A dictionary with the ``mean``, ``stdev``, ``min`` and ``max`` of the
+      calls per second over the repeats, the ``number`` of calls per repeat
+      and the ``rates`` of each repeat.
+    """
+    number = 1
+    while True:
+        t0 = clock()
+        for _ in range(number):
+            f()
+        if clock() - t0 >= min_time:
+            break
+        number *= 2
+    rates = []
+    for _ in range(repeat):
+        t0 = clock()
+        for _ in range(number):
+            f()
+        rates.append(number / (clock() - t0))
+    mean = sum(rates) / len(rates)
+    stdev = (sum((r - mean) ** 2 for r in rates) / max(len(rates) - 1, 1)) ** 0.5
+    return {'mean': mean, 'stdev': stdev, 'min': min(rates), 'max': max(rates),
+            'number': number, 'rates': rates}
+
+
+def commit():
+    """
+    Returns the current git commit, or None outside of a repository.
+    """
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('ascii').strip()
+
+
+def run(pattern=None, repeat=5, min_time=0.1):
+    """
+    Runs the benchmarks whose names contain ``pattern``, or all of them. A
+    pattern that is the name of a group of ``GROUPS`` runs that group alone.
+
+    :Returns:
+      The results, as written to JSON.
+    """
+    groups = [group for group, _ in GROUPS]
+    results = {}
+    for group, cases in GROUPS:
+        if pattern in groups and pattern != group:
+            continue
+        for name, make in cases():
+            if pattern is None or pattern == group or pattern in name:
+                results[name] = measure(make(), repeat, min_time)
+                print("%-40s %12.1f ops/s +- %4.1f%%" %
+                      (name, results[name]['mean'], 100. * results[name]['stdev'] / results[name]['mean']))
+    return {'commit': commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'machine': platform.machine(),
+            'results': results}
+
+
+def compare(base, current, threshold=0.1):
+    """
+    Compares two runs.
+
+    :Parameters:
+      base, current
+        Results of ``run``;
+      threshold
+        Relative loss of speed tolerated.
+
+    :Returns:
+      A list of ``(name, change)`` for the benchmarks of both runs that are
+      slower by more than ``threshold`` and more than twice the combined
+      standard deviation. ``change`` is the relative change of the mean rate.
+    """
+    regressions = []
+    for name in sorted(set(base['results']) & set(current['results'])):
+        b = base['results'][name]
+        c = current['results'][name]
+        noise = 2. * (b['stdev'] ** 2 + c['stdev'] ** 2) ** 0.5
+        if c['mean'] < b['mean'] * (1. - threshold) and b['mean'] - c['mean'] > noise:
+            regressions.append((name, c['mean'] / b['mean'] - 1.))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the hot paths of the simulation.")
+    parser.add_argument('--filter', default=None, help="only run the benchmarks whose names contain this, or a group: %s" %
+                        ", ".join(group for group, _ in GROUPS))
+    parser.add_argument('--repeat', type=int, default=5, help="timed repeats of each benchmark")
+    parser.add_argument('--min-time', type=float, default=0.1, help="minimum duration of a repeat, in s")
+    parser.add_argument('--output', default='bench.json', help="file where the results are written")
+    parser.add_argument('--compare', default=None, help="results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative loss of speed flagged")
+    args = parser.parse_args(argv)
+
+    current = run(args.filter, args.repeat, args.min_time)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            base = json.load(f)
+        regressions = compare(base, current, args.threshold)
+        for name, change in regressions:
+            print("regression: %s %+.1f%%" % (name, 100. * change))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
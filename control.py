@@ -1,13 +1,604 @@
 # Module level imports
+import itertools
 from fuzzy.System import System
 from fuzzy.norm.Min import Min
 from fuzzy.norm.Max import Max
+from fuzzy.norm.AlgebraicProduct import AlgebraicProduct
+from fuzzy.norm.EinsteinProduct import EinsteinProduct
 from fuzzy.defuzzify.COG import COG
+from fuzzy.defuzzify.MaxLeft import MaxLeft
+from fuzzy.defuzzify.MaxRight import MaxRight
 from fuzzy.operator.Not import Not
 from fuzzy.operator.Compound import Compound
 from fuzzy.operator.Input import Input
 from fuzzy.Rule import Rule
 from fuzzy.OutputVariable import OutputVariable
+from numpy import arange, argmax, argsort, array, asarray, atleast_1d, clip, concatenate, empty, flatnonzero, \
+    floor, full, linspace, maximum, minimum, multiply, newaxis, searchsorted, unique, zeros
+
+# Project level imports
+from mf import PiecewiseLinear, memberships
+import exact
+from exact import ExactCOG, ExactMaxLeft, ExactMaxRight
+
+
+def span(variable):
+    """
+    Returns the interval covered by the breakpoints of the membership functions
+    of a variable, in the format ``(start, end)``.
+    """
+    xs = [p[0] for adjective in variable.adjectives.values() for p in adjective.set.points]
+    return min(xs), max(xs)
+
+
+def breakpoint_matrix(adjs):
+    """
+    Stacks the breakpoints of a list of ``(adjective, xp, fp)`` into ``(n, k)``
+    matrices, as used by ``mf.memberships``. Functions with fewer breakpoints
+    are padded by repeating their last one, which does not change them.
+    """
+    k = max(len(xp) for _, xp, _ in adjs)
+    X = array([list(xp) + [xp[-1]] * (k - len(xp)) for _, xp, _ in adjs], dtype=float)
+    Y = array([list(fp) + [fp[-1]] * (k - len(fp)) for _, _, fp in adjs], dtype=float)
+    return X, Y
+
+
+# Memberships taken as zero when checking that at most two adjectives are
+# active together, since breakpoints computed apart, as by ``mf.flat_saw``,
+# are only equal up to rounding
+ACTIVE_TOLERANCE = 1e-12
+
+
+# Number of rule evaluations of a call, rows times rules, from which the
+# pruned inference is used. Below it, the fixed cost of the lookups is larger
+# than the cost of firing every rule.
+PRUNE_WORK = 8192
+
+
+def active_order(X, Y):
+    """
+    Orders a family of piecewise linear functions by their peaks, checking
+    that at most two of them, consecutive in this order, are non-zero at any
+    point: each function must be zero up to the peak before its own and from
+    the peak after it.
+
+    :Parameters:
+      X, Y
+        ``(n, k)`` matrices of breakpoints, as used by ``mf.memberships``.
+
+    :Returns:
+      A tuple ``(peaks, order)`` with the peaks in increasing order and the
+      indices of the functions in the same order, or None if more than two
+      functions can be non-zero together.
+    """
+    peaks = X[arange(len(X)), argmax(Y, axis=1)]
+    order = argsort(peaks, kind='mergesort')
+    peaks = peaks[order]
+    points = unique(X)
+    n = len(order)
+    for r, j in enumerate(order):
+        # Between breakpoints the functions are linear, so checking them at
+        # every breakpoint, and their end values, is enough
+        outside = zeros(len(points), dtype=bool)
+        if r > 0:
+            outside |= points <= peaks[r - 1]
+            if Y[j, 0] > ACTIVE_TOLERANCE:
+                return None
+        if r < n - 1:
+            outside |= points >= peaks[r + 1]
+            if Y[j, -1] > ACTIVE_TOLERANCE:
+                return None
+        if outside.any() and memberships(X[j:j + 1], Y[j:j + 1], points[outside]).max() > ACTIVE_TOLERANCE:
+            return None
+    return peaks, order
+
+
+def einstein(x, y):
+    """
+    Einstein product of two arrays of membership values.
+    """
+    return x * y / (2. - (x + y - x * y))
+
+
+# Norms and defuzzification methods by name, as used in the command line
+NORMS = {
+    'min': Min,
+    'algebraic': AlgebraicProduct,
+    'einstein': EinsteinProduct
+}
+
+DEFUZZIFIERS = {
+    'cog': COG,
+    'maxleft': MaxLeft,
+    'maxright': MaxRight,
+    'exact-cog': ExactCOG,
+    'exact-maxleft': ExactMaxLeft,
+    'exact-maxright': ExactMaxRight
+}
+
+
+# Array equivalents of the norms accepted by ``PendulumController.set_norm``
+ARRAY_NORMS = {
+    Min: minimum,
+    AlgebraicProduct: multiply,
+    EinsteinProduct: einstein
+}
+
+# Defuzzification methods supported by ``ArrayController``, all computed in
+# closed form from the breakpoints of the output set. pyfuzzy's own COG,
+# MaxLeft and MaxRight work on sampled sets, so controllers using them go
+# through ``System.calculate``
+EXACT_METHODS = {
+    ExactCOG: exact.centroid,
+    ExactMaxLeft: exact.max_left,
+    ExactMaxRight: exact.max_right
+}
+
+
+class ArrayController(object):
+    """
+    Array-native fuzzy inference. It holds the same variables, adjectives and
+    rules of a ``PendulumController``, and evaluates whole arrays of inputs at
+    once: memberships are computed as matrices, the norm is applied as a
+    broadcasted operation, the activations are aggregated with ``max`` and the
+    output set is defuzzified in closed form, in one pass.
+
+    When at most two adjectives of each input are non-zero at any point, as
+    with the functions of ``mf.flat_saw``, the rules are pruned: the two
+    adjectives of each input that can be active are found by a lookup of the
+    input among the peaks of its adjectives, and only the rules made of them
+    are fired, looked up in tables of the rules indexed by their antecedents.
+    The firing cost of a batch then grows with the number of rule tables, not
+    with the number of rules. Calls with fewer than ``PRUNE_WORK`` rows times
+    rules, such as the single rows of a simulation step, fire every rule,
+    which is cheaper then.
+    """
+
+    def __init__(self, inputs, output, rules, norm=Min, defuzzy=ExactCOG, resolution=1001, prune=True):
+        """
+        Creates the engine.
+
+        :Parameters:
+          inputs
+            List of input variables, each one in the format ``(name, adjs)``,
+            where ``adjs`` is a list of ``(adjective, xp, fp)`` with the
+            breakpoints of the piecewise linear membership function;
+          output
+            The output variable, in the same format of the inputs;
+          rules
+            List of decision rules in the format ``(antecedents, adjective)``,
+            where ``antecedents`` is a tuple of ``(variable, adjective)`` pairs
+            joined by the norm, and ``adjective`` is the consequent;
+          norm
+            The norm (``and`` operation). One of the keys of ``ARRAY_NORMS``;
+          defuzzy
+            The defuzzification method. Only the keys of ``EXACT_METHODS``
+            can be computed; others are kept so that the output set can still
+            be aggregated, as for plotting it;
+          resolution
+            Number of samples of the output universe in ``y``, over which
+            ``aggregate`` samples the output set, as for plotting it;
+          prune
+            Whether the rules are pruned when the inputs allow it. See
+            ``pruned``.
+        """
+        # The adjectives of each input are a contiguous block of columns of
+        # the membership matrix
+        self.inputs = [name for name, _ in inputs]
+        self.__blocks = []
+        self.__columns = {}
+        start = 0
+        for name, adjs in inputs:
+            for j, (adj, _, _) in enumerate(adjs):
+                self.__columns[name, adj] = start + j
+            X, Y = breakpoint_matrix(adjs)
+            self.__blocks.append((name, X, Y, start, start + len(adjs)))
+            start += len(adjs)
+        self.__ncolumns = start
+        # Peaks of the adjectives of each input in increasing order, with the
+        # columns of the adjectives in the same order, or None if more than
+        # two adjectives of the input can be non-zero together
+        self.__peaks = {}
+        for name, X, Y, start, _ in self.__blocks:
+            lookup = active_order(X, Y)
+            self.__peaks[name] = None if lookup is None else (lookup[0], start + lookup[1])
+
+        self.output, adjs = output
+        self.output_names = [adj for adj, _, _ in adjs]
+        self.__index = dict((adj, k) for k, adj in enumerate(self.output_names))
+        xo = min(min(xp) for _, xp, _ in adjs)
+        xf = max(max(xp) for _, xp, _ in adjs)
+        self.y = linspace(xo, xf, resolution)
+        X, Y = breakpoint_matrix(adjs)
+        self.sets = memberships(X, Y, self.y).T
+        # Samples where each output set is non-zero, the only ones it can
+        # raise in the aggregated set
+        self.__support = [(flatnonzero(s)[0], flatnonzero(s)[-1] + 1) if s.any() else (0, 0) for s in self.sets]
+        self.__output = (X, Y, exact.layout(X, Y))
+
+        # Rule matrix: the columns of the antecedents of each rule and the
+        # index of its consequent
+        self.antecedents = array([[self.__columns[a] for a in ante] for ante, _ in rules], dtype=int)
+        self.consequents = array([self.__index[adj] for _, adj in rules], dtype=int)
+        if len(rules) == 0:
+            self.antecedents = self.antecedents.reshape(0, 2)
+        self.prune = prune
+        self.__group_rules()
+        self.adjective_ids = {}  # Adjective object ids to names, see from_controller
+
+        self.set_norm(norm)
+        self.set_defuzzy(defuzzy)
+
+    def __group_rules(self):
+        """
+        Sorts the rules by consequent, so that each output adjective
+        aggregates a contiguous group of columns of the firing strengths.
+        """
+        self.__order = argsort(self.consequents, kind='mergesort')
+        cons = self.consequents[self.__order]
+        self.__groups = concatenate(([0], flatnonzero(cons[1:] != cons[:-1]) + 1)).astype(int)
+        self.__fired = cons[self.__groups[:len(cons)]]
+        self.__tabulate()
+
+    def __tabulate(self):
+        """
+        Builds the tables of the rules used by the pruned inference. Rules over
+        the same input variables, in the same order, share a table indexed by
+        the rank of each antecedent among the adjectives of its variable, and
+        holding the rule number, or -1. Rules with the same antecedents as
+        another one go to a table of their own.
+        """
+        owner = {}
+        for name, _, _, start, stop in self.__blocks:
+            owner.update((c, name) for c in range(start, stop))
+        self.__used = sorted(set(owner[c] for c in self.antecedents.ravel()))
+        self.__tables = []
+        # Whether the rules are pruned: asked for, and possible for every
+        # input used by the rules
+        self.pruned = self.prune and all(self.__peaks[name] is not None for name in self.__used)
+        if not self.pruned:
+            return
+        rank = {}
+        for name in self.__used:
+            for r, c in enumerate(self.__peaks[name][1]):
+                rank[c] = (name, r)
+        tables = {}
+        for i, ante in enumerate(self.antecedents):
+            names = tuple(rank[c][0] for c in ante)
+            index = tuple(rank[c][1] for c in ante)
+            layer = 0
+            while (names, layer) in tables and tables[names, layer][index] >= 0:
+                layer += 1
+            if (names, layer) not in tables:
+                # One more slot along each axis, so that the adjective after
+                # the last one is always found empty
+                shape = tuple(len(self.__peaks[name][0]) + 1 for name in names)
+                tables[names, layer] = full(shape, -1, dtype=int)
+            tables[names, layer][index] = i
+        for names, layer in sorted(tables):
+            # The columns of the adjectives repeat the last one, for the empty
+            # slot after it
+            columns = [concatenate((self.__peaks[name][1], self.__peaks[name][1][-1:])) for name in names]
+            corners = array(list(itertools.product((0, 1), repeat=len(names))), dtype=int)
+            self.__tables.append((names, columns, tables[names, layer], corners))
+
+    def add_rule(self, antecedents, adjective):
+        """
+        Appends a rule to the rule matrix.
+
+        :Parameters:
+          antecedents
+            Tuple of ``(variable, adjective)`` pairs joined by the norm;
+          adjective
+            Name of the consequent.
+        """
+        if len(self.consequents) == 0:
+            self.antecedents = self.antecedents.reshape(0, len(antecedents))
+        if len(antecedents) != self.antecedents.shape[1]:
+            raise ValueError("every rule must have %d antecedents" % self.antecedents.shape[1])
+        row = array([[self.__columns[a] for a in antecedents]], dtype=int)
+        self.antecedents = concatenate((self.antecedents, row))
+        self.consequents = concatenate((self.consequents, [self.__index[adjective]])).astype(int)
+        self.__group_rules()
+
+    @classmethod
+    def from_controller(cls, controller, resolution=1001):
+        """
+        Builds the engine from the variables, adjectives and rules of a
+        ``PendulumController``, with its current norm and defuzzification.
+        """
+        names = {}
+        inputs = []
+        output = None
+        for vname in sorted(controller.variables):
+            variable = controller.variables[vname]
+            adjs = []
+            for aname, adjective in variable.adjectives.items():
+                names[id(adjective)] = (vname, aname)
+                points = adjective.set.points
+                adjs.append((aname, [p[0] for p in points], [p[1] for p in points]))
+            adjs.sort(key=lambda adj: (adj[1], adj[2]))
+            if isinstance(variable, OutputVariable):
+                output = (vname, adjs)
+            else:
+                inputs.append((vname, adjs))
+        rules = []
+        for rname in sorted(controller.rules, key=int):
+            rule = controller.rules[rname]
+            ante = tuple(names[id(i.adjective)] for i in rule.operator.inputs)
+            rules.append((ante, names[id(rule.adjective)][1]))
+        engine = cls(inputs, output, rules, controller.__AND__, controller.defuzzy, resolution)
+        engine.adjective_ids = names
+        return engine
+
+    def set_norm(self, norm):
+        if norm not in ARRAY_NORMS:
+            raise ValueError("norm not supported: %r" % (norm,))
+        self.norm = norm
+        self.__norm = ARRAY_NORMS[norm]
+
+    def set_defuzzy(self, defuzzy):
+        self.defuzzy = defuzzy
+
+    def memberships(self, input):
+        """
+        Computes the membership of every input adjective.
+
+        :Parameters:
+          input
+            Dictionary mapping input variable names to arrays of values, all
+            with the same length. Missing variables have every membership set
+            to zero, as in the scalar controller.
+
+        :Returns:
+          An ``(N, n)`` matrix, with a column for each input adjective.
+        """
+        n = len(atleast_1d(next(iter(input.values()))))
+        M = zeros((n, self.__ncolumns))
+        for name, X, Y, start, stop in self.__blocks:
+            if name in input:
+                M[:, start:stop] = memberships(X, Y, input[name])
+        return M
+
+    def fire(self, M):
+        """
+        Firing strengths of every rule, in an ``(N, R)`` matrix, given the
+        matrix of memberships.
+        """
+        ante = self.antecedents
+        s = M[:, ante[:, 0]]
+        for a in range(1, ante.shape[1]):
+            s = self.__norm(s, M[:, ante[:, a]])
+        return s
+
+    def activate(self, s):
+        """
+        Aggregates the firing strengths of the rules into the activation of
+        every output adjective, in an ``(N, K)`` matrix.
+        """
+        alpha = zeros((s.shape[0], len(self.output_names)))
+        if s.shape[1] > 0:
+            alpha[:, self.__fired] = maximum.reduceat(s[:, self.__order], self.__groups, axis=1)
+        return alpha
+
+    def activate_pruned(self, M, input):
+        """
+        Same as ``activate(fire(M))``, firing only the rules whose antecedents
+        can be non-zero for each row. Only available while ``pruned``.
+
+        :Parameters:
+          M
+            The matrix of memberships;
+          input
+            Dictionary of the arrays of inputs ``M`` was computed from.
+        """
+        rows = arange(M.shape[0])[:, newaxis]
+        K = len(self.output_names)
+        alpha = zeros((M.shape[0], K))
+        # Rank of the first of the two adjectives of each input that can be
+        # non-zero
+        lower = {}
+        for name in self.__used:
+            if name in input:
+                peaks = self.__peaks[name][0]
+                lower[name] = clip(searchsorted(peaks, input[name], 'right') - 1, 0, max(len(peaks) - 2, 0))
+        for names, columns, table, corners in self.__tables:
+            if any(name not in lower for name in names):
+                continue  # Missing inputs have every membership set to zero
+            # Ranks of the antecedents of the rules that can fire, with a
+            # column for each corner of the cell of the table holding the row
+            index = [lower[name][:, newaxis] + corners[:, a] for a, name in enumerate(names)]
+            rule = table[tuple(index)]
+            s = M[rows, columns[0][index[0]]]
+            for a in range(1, len(names)):
+                s = self.__norm(s, M[rows, columns[a][index[a]]])
+            s[rule < 0] = 0.  # Empty cells, whose rule number picks the last rule
+            # Rules of a row can share a consequent, hence the unbuffered max
+            maximum.at(alpha.reshape(-1), (rows * K + self.consequents[rule]).ravel(), s.ravel())
+        return alpha
+
+    def aggregate(self, alpha):
+        """
+        Output fuzzy set sampled over ``y``, in an ``(N, S)`` matrix, given
+        the activations of the output adjectives. Only used to plot it; the
+        outputs are computed from its exact breakpoints.
+        """
+        mu = zeros((alpha.shape[0], len(self.y)))
+        for k, (lo, hi) in enumerate(self.__support):
+            part = mu[:, lo:hi]
+            maximum(part, minimum(self.sets[k, lo:hi], alpha[:, k:k + 1]), part)
+        return mu
+
+    def exact(self, alpha):
+        """
+        Defuzzifies the output set given by the activations of the output
+        adjectives in closed form, with the current method.
+        """
+        if self.defuzzy not in EXACT_METHODS:
+            raise ValueError("defuzzification not supported: %r" % (self.defuzzy,))
+        X, Y, plan = self.__output
+        return EXACT_METHODS[self.defuzzy](*exact.aggregate(X, Y, alpha, plan))
+
+    def __call__(self, input, chunk=4096):
+        """
+        Evaluates the controller over arrays of inputs.
+
+        :Parameters:
+          input
+            Dictionary mapping input variable names to arrays of values;
+          chunk
+            Maximum number of rows processed at a time, which bounds the size
+            of the output sets held in memory.
+
+        :Returns:
+          An array with the output for each row.
+        """
+        input = dict((name, atleast_1d(asarray(x, dtype=float))) for name, x in input.items())
+        n = len(next(iter(input.values())))
+        out = empty(n)
+        for i in range(0, n, chunk):
+            # Only the memberships of the inputs used by the rules matter
+            part = dict((name, input[name][i:i + chunk]) for name in self.__used if name in input)
+            if not part:
+                part = dict((name, x[i:i + chunk]) for name, x in input.items())
+            M = self.memberships(part)
+            if self.pruned and len(M) * len(self.consequents) >= PRUNE_WORK:
+                alpha = self.activate_pruned(M, part)
+            else:
+                alpha = self.activate(self.fire(M))
+            out[i:i + chunk] = self.exact(alpha)
+        return out
+
+    def max_error(self, controller, input):
+        """
+        Largest absolute difference against the scalar path of a controller
+        over the given arrays of inputs.
+        """
+        fast = self(input)
+        names = list(input)
+        error = 0.
+        for i, row in enumerate(zip(*[input[name] for name in names])):
+            exact = controller.calculate(dict(zip(names, row)), {self.output: 0.0})[self.output]
+            error = max(error, abs(fast[i] - exact))
+        return error
+
+
+class ControlSurface(object):
+    """
+    Control surface of a two input controller. The controller is sampled once
+    over a regular grid and queries are answered by bilinear interpolation.
+    """
+
+    def __init__(self, controller, inputs=('O', 'w'), output='F', ranges=None, resolution=(61, 61)):
+        """
+        Samples the controller over the grid.
+
+        :Parameters:
+          controller
+            The controller to be sampled. It is evaluated through the exact
+            ``calculate`` path;
+          inputs
+            Names of the two input variables, in the format ``(x1, x2)``;
+          output
+            Name of the output variable;
+          ranges
+            Intervals of the inputs, in the format ``((x1o, x1f), (x2o, x2f))``.
+            If none is given, the span of the membership functions of each
+            input is used. Outside of this span the membership functions are
+            flat, so clamping the inputs to it is exact;
+          resolution
+            Number of samples along each input, in the format ``(n1, n2)``.
+            At least 2 samples are needed along each input.
+        """
+        if min(resolution) < 2:
+            raise ValueError("a control surface needs at least 2 samples along each input, got %r"
+                             % (tuple(resolution),))
+        if ranges is None:
+            ranges = [span(controller.variables[name]) for name in inputs]
+        self.inputs = tuple(inputs)
+        self.output = output
+        self.x1 = linspace(ranges[0][0], ranges[0][1], resolution[0])
+        self.x2 = linspace(ranges[1][0], ranges[1][1], resolution[1])
+        self.table = empty((len(self.x1), len(self.x2)))
+        for i, a in enumerate(self.x1):
+            for j, b in enumerate(self.x2):
+                self.table[i, j] = self.__exact(controller, a, b)
+        self.error = None
+
+        # Scalars used by the fast path of __call__
+        self.__x1o = float(self.x1[0])
+        self.__x2o = float(self.x2[0])
+        self.__dx1 = float(self.x1[1] - self.x1[0])
+        self.__dx2 = float(self.x2[1] - self.x2[0])
+        self.__n1 = len(self.x1) - 2
+        self.__n2 = len(self.x2) - 2
+        self.__rows = self.table.tolist()
+
+    def __exact(self, controller, a, b):
+        input = {self.inputs[0]: a, self.inputs[1]: b}
+        return controller.calculate(input, {self.output: 0.0})[self.output]
+
+    def __call__(self, a, b):
+        """
+        Interpolates the output for a single pair of inputs.
+        """
+        u = (a - self.__x1o) / self.__dx1
+        i = min(max(int(floor(u)), 0), self.__n1)
+        u = min(max(u - i, 0.), 1.)
+        v = (b - self.__x2o) / self.__dx2
+        j = min(max(int(floor(v)), 0), self.__n2)
+        v = min(max(v - j, 0.), 1.)
+        r0 = self.__rows[i]
+        r1 = self.__rows[i + 1]
+        return (1. - u) * ((1. - v) * r0[j] + v * r0[j + 1]) + u * ((1. - v) * r1[j] + v * r1[j + 1])
+
+    def evaluate(self, a, b):
+        """
+        Interpolates the output for arrays of inputs.
+
+        :Parameters:
+          a
+            Values of the first input;
+          b
+            Values of the second input, with the same shape as ``a``.
+
+        :Returns:
+          An array with the interpolated outputs.
+        """
+        u = (asarray(a, dtype=float) - self.__x1o) / self.__dx1
+        i = clip(floor(u).astype(int), 0, self.__n1)
+        u = clip(u - i, 0., 1.)
+        v = (asarray(b, dtype=float) - self.__x2o) / self.__dx2
+        j = clip(floor(v).astype(int), 0, self.__n2)
+        v = clip(v - j, 0., 1.)
+        t = self.table
+        return (1. - u) * ((1. - v) * t[i, j] + v * t[i, j + 1]) + u * ((1. - v) * t[i + 1, j] + v * t[i + 1, j + 1])
+
+    def error_bound(self, controller):
+        """
+        Estimates the largest interpolation error against the exact
+        controller. Bilinear interpolation is exact at the grid nodes, so the
+        controller is compared at the center of every cell and at the middle
+        of every edge.
+
+        :Parameters:
+          controller
+            The controller the surface was sampled from.
+
+        :Returns:
+          The largest absolute difference found. It is also kept in the
+          ``error`` attribute.
+        """
+        x1 = linspace(self.x1[0], self.x1[-1], 2 * len(self.x1) - 1)
+        x2 = linspace(self.x2[0], self.x2[-1], 2 * len(self.x2) - 1)
+        error = 0.
+        for i, a in enumerate(x1):
+            for j, b in enumerate(x2):
+                if i % 2 == 0 and j % 2 == 0:
+                    continue
+                error = max(error, abs(self(a, b) - self.__exact(controller, a, b)))
+        self.error = error
+        return error
 
 
 class PendulumController(System):
@@ -36,34 +627,179 @@ class PendulumController(System):
         self.__AND__ = norm
         self.__OR__ = conorm
         self.__NOT__ = negation
+        self.surfaces = {}
+        self.surface = None
+        self.__surface_args = None
+        self.__engine = None
+        self.__revision = None
+        self.__synced = True
+        self.use_engine = False
+        self.__used = None  # Names of the inputs used by the rules
 
     def __call__(self, input, output):
+        if self.__surface_args is not None:
+            if self.surface is None:
+                self.__update_surface()
+            x1, x2 = self.surface.inputs
+            return self.surface(input[x1], input[x2])
+        if self.use_engine and self.supported():
+            engine = self.get_engine()
+            if len(output) == 1 and engine.output in output:
+                return float(engine(input)[0])
+        # Inputs without rules, such as x and v in the default controller, are
+        # not fuzzified
+        used = self.__used
+        if used is None:
+            used = self.__used = self.used_inputs()
+        if len(input) > len(used):
+            input = dict((name, value) for name, value in input.items() if name in used)
         od = self.calculate(input, output)
         for o in od:
             return od[o]
 
+    def __setstate__(self, state):
+        # The compiled form knows the adjectives by the ids of the objects
+        # that were pickled, not of the ones just created
+        self.__dict__.update(state)
+        if self.__engine is not None:
+            self.__engine.adjective_ids = dict(
+                (id(adjective), (vname, aname))
+                for vname, variable in self.variables.items()
+                for aname, adjective in variable.adjectives.items())
+            self.__revision = PiecewiseLinear.revision
+
+    def used_inputs(self):
+        """
+        Returns the set of names of the input variables used by the rules.
+        """
+        owner = dict((id(adjective), vname)
+                     for vname, variable in self.variables.items()
+                     for adjective in variable.adjectives.values())
+        return frozenset(owner[id(i.adjective)] for rule in self.rules.values() for i in rule.operator.inputs)
+
+    def supported(self):
+        """
+        Tells if the norm and the defuzzification method in use can be
+        computed by the compiled form.
+        """
+        return self.__AND__ in ARRAY_NORMS and self.defuzzy in EXACT_METHODS
+
+    def set_engine(self, enabled):
+        """
+        Switches between the compiled form and the exact inference through the
+        pyfuzzy objects, which is the default. Norms and defuzzification
+        methods that the compiled form does not support always use the exact
+        inference.
+        """
+        self.use_engine = enabled
+
+    def get_engine(self):
+        """
+        Returns the compiled form of the controller, an ``ArrayController``
+        holding the rule base as index arrays. It is built on first use and
+        kept up to date by ``add_rule``, ``set_norm`` and ``set_defuzzy``.
+        It is built again after the breakpoints of a ``mf.PiecewiseLinear``
+        are edited; other sets must be followed by a call to ``invalidate``.
+        """
+        if self.__engine is None or self.__revision != PiecewiseLinear.revision:
+            self.__engine = ArrayController.from_controller(self)
+            self.__revision = PiecewiseLinear.revision
+        return self.__engine
+
+    def evaluate(self, input, output='F'):
+        """
+        Evaluates the controller over arrays of inputs, as a batched
+        controller for ``ip.BatchPendulum.step``. The compiled form is used
+        if it supports the norm and the defuzzification method in use, and
+        else every row goes through ``calculate``.
+
+        :Parameters:
+          input
+            Dictionary mapping input variable names to arrays of values;
+          output
+            Name of the output variable.
+
+        :Returns:
+          An array with the output for each row.
+        """
+        if self.supported():
+            return self.get_engine()(input)
+        names = list(input)
+        columns = [atleast_1d(input[name]) for name in names]
+        out = empty(len(columns[0]))
+        for i, row in enumerate(zip(*columns)):
+            out[i] = self.calculate(dict(zip(names, row)), {output: 0.0})[output]
+        return out
+
+    def invalidate(self):
+        """
+        Drops the compiled form, the sampled surfaces and the breakpoints kept
+        by the closed-form defuzzification, after the membership functions
+        were changed in place.
+        """
+        self.__engine = None
+        self.__used = None
+        self.surfaces = {}
+        if self.__surface_args is not None:
+            self.surface = None
+        for variable in self.variables.values():
+            if isinstance(variable, OutputVariable) and isinstance(variable.defuzzify, exact.Exact):
+                variable.defuzzify.invalidate()
+
+    def calculate(self, input, output):
+        """
+        Exact inference through the pyfuzzy objects. The norm and the
+        defuzzification method are only propagated to these objects here,
+        so that switching them does not walk the rule base every time.
+        """
+        if not self.__synced:
+            for rule in self.rules.values():
+                rule.operator.norm = self.__AND__()
+            for variable in self.variables.values():
+                if isinstance(variable, OutputVariable):
+                    variable.defuzzify = self.defuzzy()
+            self.__synced = True
+        return super(PendulumController, self).calculate(input, output)
+
     def add_rule(self, opr_adjs, adjective):
         """
         Adds a decision rule to the knowledge base.
 
         :Parameters:
           opr_adjs
-            The input adjectives
+            The input adjectives, joined by the norm. Every rule of a
+            controller must have as many of them
           adjective
             The output adjective
         """
-        adj1, adj2 = opr_adjs
+        for rule in self.rules.values():
+            if len(rule.operator.inputs) != len(opr_adjs):
+                raise ValueError("every rule must have %d antecedents" % len(rule.operator.inputs))
+            break
+        self.__used = None
+        # Sampled surfaces do not know about the new rule
+        self.surfaces = {}
+        self.surface = None
         rule_num = len(self.rules) + 1
         self.rules[str(rule_num)] = Rule(
             adjective=adjective,
             # it gets its value from here
             operator=Compound(
                 self.__AND__(),
-                Input(adj1),
-                Input(adj2)
+                *[Input(adj) for adj in opr_adjs]
             )
         )
 
+        # Appends the rule to the compiled form. Adjectives it has not seen,
+        # such as those of a variable created after it, force a rebuild.
+        engine = self.__engine
+        if engine is not None:
+            ids = engine.adjective_ids
+            if all(id(adj) in ids for adj in opr_adjs) and id(adjective) in ids:
+                engine.add_rule(tuple(ids[id(adj)] for adj in opr_adjs), ids[id(adjective)][1])
+            else:
+                self.__engine = None
+
     def add_table(self, lx1, lx2, table):
         """
         Adds a table of decision rules in a two variable controller.
@@ -85,13 +821,59 @@ class PendulumController(System):
                 if my is not None:
                     self.add_rule((lx1[i], lx2[j]), my)
 
+    def compile(self, inputs=('O', 'w'), output='F', ranges=None, resolution=(61, 61)):
+        """
+        Switches the controller to a precomputed control surface. Surfaces are
+        cached per norm and defuzzification method, so changing them after
+        the first time does not sample the controller again.
+
+        :Parameters:
+          inputs
+            Names of the two input variables of the surface;
+          output
+            Name of the output variable;
+          ranges
+            Intervals of the inputs. See ``ControlSurface``;
+          resolution
+            Number of samples along each input.
+
+        :Returns:
+          The control surface in use.
+        """
+        self.__surface_args = (tuple(inputs), output,
+                               None if ranges is None else tuple(map(tuple, ranges)),
+                               tuple(resolution))
+        self.__update_surface()
+        return self.surface
+
+    def decompile(self):
+        """
+        Switches the controller back to the exact inference.
+        """
+        self.surface = None
+        self.__surface_args = None
+
+    def __update_surface(self):
+        if self.__surface_args is None:
+            return
+        key = (self.__AND__, self.defuzzy) + self.__surface_args
+        if key not in self.surfaces:
+            self.surfaces[key] = ControlSurface(self, *self.__surface_args)
+        self.surface = self.surfaces[key]
+
     def set_norm(self, norm):
         self.__AND__ = norm
-        for rule in self.rules.values():
-            rule.operator.norm = self.__AND__()
+        self.__synced = False
+        if self.__engine is not None:
+            if norm in ARRAY_NORMS:
+                self.__engine.set_norm(norm)
+            else:
+                self.__engine = None
+        self.__update_surface()
 
     def set_defuzzy(self, defuzzy):
         self.defuzzy = defuzzy
-        for variable in self.variables.values():
-            if isinstance(variable, OutputVariable):
-                variable.defuzzify = self.defuzzy()
+        self.__synced = False
+        if self.__engine is not None:
+            self.__engine.set_defuzzy(defuzzy)
+        self.__update_surface()
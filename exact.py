@@ -0,0 +1,184 @@
+"""
+Closed-form defuzzification of piecewise linear output sets. The aggregated
+output set ``mu(y) = max_k min(f_k(y), alpha_k)`` of piecewise linear
+functions ``f_k`` clipped at the activations ``alpha_k`` is itself piecewise
+linear. Its breakpoints are the breakpoints of the ``f_k``, the crossings of
+two ``f_k`` and the points where some ``f_k`` equals some ``alpha_m``. Once
+they are known, the centroid and the maxima are computed exactly.
+"""
+# Module level imports
+from fuzzy.defuzzify.Base import Base
+from numpy import array, concatenate, newaxis, nonzero, sort, unique, where
+
+# Project level imports
+from mf import PiecewiseLinear, memberships
+
+# Membership degrees closer than this to the maximum are taken as maximal, so
+# that the ends of a clipped plateau survive rounding
+TOLERANCE = 1e-9
+
+
+def segments(X, Y):
+    """
+    Returns the segments of a family of piecewise linear functions, as four
+    flat arrays ``(x0, y0, x1, y1)``.
+    """
+    return X[:, :-1].ravel(), Y[:, :-1].ravel(), X[:, 1:].ravel(), Y[:, 1:].ravel()
+
+
+def layout(X, Y):
+    """
+    Precomputes what the breakpoints of the aggregated set depend on.
+
+    :Returns:
+      A tuple ``(static, segment, level)``. ``static`` holds the breakpoints
+      that do not depend on the activations: those of every function and the
+      crossings of every pair of segments. The others are where segment
+      ``segment[i]`` equals the activation of function ``level[i]``; only the
+      segments overlapping the breakpoint range of that function are listed,
+      since the plateau of a function clipped at its activation cannot meet
+      the others.
+    """
+    x0, y0, x1, y1 = segments(X, Y)
+    sloped = x1 > x0
+    b = where(sloped, (y1 - y0) / where(sloped, x1 - x0, 1.), 0.)
+    a = y0 - b * x0
+    db = b[:, newaxis] - b[newaxis, :]
+    parallel = db == 0.
+    xc = (a[newaxis, :] - a[:, newaxis]) / where(parallel, 1., db)
+    inside = (~parallel & sloped[:, newaxis] & sloped[newaxis, :] &
+              (xc >= x0[:, newaxis]) & (xc <= x1[:, newaxis]) &
+              (xc >= x0[newaxis, :]) & (xc <= x1[newaxis, :]))
+    static = unique(concatenate((X.ravel(), xc[inside])))
+    lo = X.min(axis=1)
+    hi = X.max(axis=1)
+    overlap = ((x0[:, newaxis] < hi[newaxis, :]) & (x1[:, newaxis] > lo[newaxis, :]) &
+               (y1 != y0)[:, newaxis])
+    segment, level = nonzero(overlap)
+    return static, segment, level
+
+
+def aggregate(X, Y, alpha, plan=None):
+    """
+    Computes the aggregated set at all of its breakpoints.
+
+    :Parameters:
+      X, Y
+        ``(K, k)`` breakpoint matrices of the output adjectives, as in
+        ``mf.memberships``;
+      alpha
+        ``(N, K)`` matrix with the activation of each adjective;
+      plan
+        The result of ``layout(X, Y)``, if already known.
+
+    :Returns:
+      A tuple ``(u, mu)`` of ``(N, C)`` matrices with the breakpoints, in
+      increasing order along each line, and the aggregated set at them.
+      Between consecutive breakpoints the set is linear.
+    """
+    if plan is None:
+        plan = layout(X, Y)
+    static, segment, level = plan
+    xo = X.min()
+    x0, y0, x1, y1 = [z[segment] for z in segments(X, Y)]
+    t = (alpha[:, level] - y0) / (y1 - y0)
+    u = where((t >= 0.) & (t <= 1.), x0 + t * (x1 - x0), xo)
+    n = alpha.shape[0]
+    u = sort(concatenate((u, static[newaxis, :].repeat(n, axis=0)), axis=1), axis=1)
+    F = memberships(X, Y, u.ravel()).reshape(u.shape + (X.shape[0],))
+    mu = (F.clip(None, alpha[:, newaxis, :])).max(axis=2)
+    return u, mu
+
+
+def centroid(u, mu):
+    """
+    Exact center of gravity of piecewise linear sets given by ``aggregate``.
+    As pyfuzzy, raises ``ValueError`` if a set has zero area, since its
+    center of gravity is undefined.
+    """
+    a = u[:, :-1]
+    b = u[:, 1:]
+    ma = mu[:, :-1]
+    mb = mu[:, 1:]
+    area = ((b - a) * (ma + mb) / 2.).sum(axis=1)
+    moment = ((b - a) * (a * (2. * ma + mb) + b * (ma + 2. * mb)) / 6.).sum(axis=1)
+    if (area == 0.).any():
+        raise ValueError("center of gravity of an empty output set")
+    return moment / area
+
+
+def max_left(u, mu):
+    """
+    Smallest point where each set given by ``aggregate`` reaches its maximum.
+    """
+    top = mu >= mu.max(axis=1)[:, newaxis] - TOLERANCE
+    return u[range(len(u)), top.argmax(axis=1)]
+
+
+def max_right(u, mu):
+    """
+    Largest point where each set given by ``aggregate`` reaches its maximum.
+    """
+    top = mu >= mu.max(axis=1)[:, newaxis] - TOLERANCE
+    return u[range(len(u)), u.shape[1] - 1 - top[:, ::-1].argmax(axis=1)]
+
+
+class Exact(Base):
+    """
+    Base of the pyfuzzy defuzzification methods computed in closed form.
+    The adjectives of the variable must have polygonal sets.
+
+    The breakpoint matrices of the output adjectives and their ``layout`` are
+    kept between calls. They are computed again when the adjectives change
+    or the breakpoints of a ``mf.PiecewiseLinear`` are edited; edits to other
+    sets must be followed by a call to ``invalidate``.
+    """
+
+    method = None
+
+    def __init__(self, *args, **keywords):
+        Base.__init__(self, *args, **keywords)
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Drops the breakpoints kept from the previous calls.
+        """
+        self.__key = None
+        self.__output = None
+
+    def getValue(self, variable):
+        adjectives = list(variable.adjectives.values())
+        key = (PiecewiseLinear.revision, [id(a) for a in adjectives])
+        if key != self.__key:
+            k = max(len(adjective.set.points) for adjective in adjectives)
+            X = array([[p[0] for p in a.set.points] + [a.set.points[-1][0]] * (k - len(a.set.points))
+                       for a in adjectives], dtype=float)
+            Y = array([[p[1] for p in a.set.points] + [a.set.points[-1][1]] * (k - len(a.set.points))
+                       for a in adjectives], dtype=float)
+            self.__output = (X, Y, layout(X, Y))
+            self.__key = key
+        X, Y, plan = self.__output
+        alpha = array([[a.getMembership() for a in adjectives]], dtype=float)
+        return float(self.method(*aggregate(X, Y, alpha, plan))[0])
+
+
+class ExactCOG(Exact):
+    """
+    Exact center of gravity.
+    """
+    method = staticmethod(centroid)
+
+
+class ExactMaxLeft(Exact):
+    """
+    Exact left global maximum.
+    """
+    method = staticmethod(max_left)
+
+
+class ExactMaxRight(Exact):
+    """
+    Exact right global maximum.
+    """
+    method = staticmethod(max_right)
@@ -0,0 +1,163 @@
+"""
+Runs the closed loop of the inverted pendulum without any graphical interface
+and writes the trajectory to a binary file.
+
+The trajectory is saved with ``numpy.save`` as a structured array with the
+fields of ``ip.TRACK_DTYPE``, one record per step. It can be read back with
+``numpy.load``.
+"""
+# Module level imports
+from __future__ import print_function
+import argparse
+from timeit import default_timer as clock
+
+# Reference of the import and first step times. numpy, pyfuzzy and the project
+# modules are only imported by the functions, so that they are timed from here
+START = clock()
+
+
+def run(ip, pc, steps, ratio=1, delay=0, profiler=None, recorder=None, chunk=4096):
+    """
+    Simulates the closed loop, in blocks of ``chunk`` steps.
+
+    :Parameters:
+      ip
+        The inverted pendulum, already in its initial state;
+      pc
+        The controller;
+      steps
+        Number of steps to be simulated;
+      ratio, delay
+        Physics steps per control period and sensor delay. See
+        ``scheduler.MultiRate``;
+      profiler
+        A ``profiler.Profiler`` timing each step, or None;
+      recorder
+        A ``recorder.Recorder`` to which the trajectory is streamed after
+        each block, or None. As in ``worker.SimulationWorker``, each record
+        holds the state after a step, at the time it is reached, with the
+        force that led to it;
+      chunk
+        Number of steps in each block.
+
+    :Returns:
+      An array of ``TRACK_DTYPE`` records, with the state before each step and
+      the force applied in it.
+    """
+    # Project level imports
+    from numpy import arange, empty
+    from ip import TIMED_DTYPE, TRACK_DTYPE
+    from scheduler import MultiRate
+
+    track = empty(steps, dtype=TRACK_DTYPE)
+    scheduler = None
+    if ratio != 1 or delay != 0 or profiler is not None:
+        scheduler = MultiRate(ip, pc, ratio, delay, profiler)
+    Ot = track['O']
+    wt = track['w']
+    xt = track['x']
+    vt = track['v']
+    Ft = track['F']
+    for start in range(0, steps, chunk):
+        end = min(start + chunk, steps)
+        if scheduler is not None:
+            scheduler.run(end - start, track[start:end])
+        else:
+            O, w, x, v = ip.get_state()
+            for i in range(start, end):
+                F = pc({'O': O, 'w': w, 'x': x, 'v': v}, {'F': 0.0})
+                Ot[i] = O
+                wt[i] = w
+                xt[i] = x
+                vt[i] = v
+                Ft[i] = F
+                O, w, x, v = ip.apply(F)
+        if recorder is not None:
+            # Each state is the one before the next step, and the last one
+            # is the current state of the pendulum
+            block = empty(end - start, dtype=TIMED_DTYPE)
+            block['t'] = (arange(start, end) + 1) * ip.dt
+            for name, value in zip(('O', 'w', 'x', 'v'), ip.get_state()):
+                block[name][:-1] = track[name][start + 1:end]
+                block[name][-1] = value
+            block['F'] = Ft[start:end]
+            recorder.extend(block, pc.__AND__, pc.defuzzy)
+    return track
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulates the inverted pendulum without a graphical interface.")
+    parser.add_argument('--theta', type=float, default=22.5, help="initial angle, in degrees")
+    parser.add_argument('--omega', type=float, default=0., help="initial angular velocity, in rad/s")
+    parser.add_argument('--x', type=float, default=0., help="initial cart position, in m")
+    parser.add_argument('--v', type=float, default=0., help="initial cart speed, in m/s")
+    parser.add_argument('--duration', type=float, default=10., help="simulated time, in s")
+    parser.add_argument('--dt', type=float, default=0.01, help="time step, in s")
+    parser.add_argument('--norm', default='min', help="one of the keys of control.NORMS")
+    parser.add_argument('--defuzzy', default='cog', help="one of the keys of control.DEFUZZIFIERS")
+    parser.add_argument('--engine', action='store_true', help="use the compiled rule matrix")
+    parser.add_argument('--table', action='store_true', help="use the precomputed control surface")
+    parser.add_argument('--integrator', default=None,
+                        help="integration method, one of the keys of integrators.INTEGRATORS; "
+                             "defaults to the built-in semi-implicit Euler step")
+    parser.add_argument('--substeps', type=int, default=1, help="integrator steps per time step")
+    parser.add_argument('--ratio', type=int, default=1, help="physics steps per control period")
+    parser.add_argument('--delay', type=int, default=0, help="sensor delay, in physics steps")
+    parser.add_argument('--output', default='trajectory.npy', help="file where the trajectory is written")
+    parser.add_argument('--no-cache', action='store_true', help="build the controller instead of loading it")
+    parser.add_argument('--profile', default=None, help="file where the timings of each phase are written")
+    parser.add_argument('--record', default=None, help="directory where the trajectory is recorded, see recorder.py")
+    args = parser.parse_args(argv)
+
+    # Project level imports
+    from numpy import pi, save
+    from control import NORMS, DEFUZZIFIERS
+    from integrators import INTEGRATORS
+    from ip import CACHE_DIR, InvertedPendulum, load_controller
+    from profiler import Profiler
+    from recorder import Recorder
+    imported = clock()
+
+    for name, value, choices in (('norm', args.norm, NORMS), ('defuzzy', args.defuzzy, DEFUZZIFIERS),
+                                 ('integrator', args.integrator, INTEGRATORS)):
+        if value is not None and value not in choices:
+            parser.error("argument --%s: invalid choice: %r (choose from %s)"
+                         % (name, value, ", ".join(sorted(choices))))
+
+    ip = InvertedPendulum(dt=args.dt, integrator=args.integrator, substeps=args.substeps)
+    ip.set_state(args.theta * pi / 180., args.omega, args.x, args.v)
+    pc = load_controller(None if args.no_cache else CACHE_DIR)
+    pc.set_norm(NORMS[args.norm])
+    pc.set_defuzzy(DEFUZZIFIERS[args.defuzzy])
+    pc.set_engine(args.engine)
+    if args.table:
+        pc.compile()
+
+    # The controller output of the first step is computed apart, since it
+    # pays for whatever the controller still builds lazily
+    pc({'O': ip.O, 'w': ip.w, 'x': ip.x, 'v': ip.v}, {'F': 0.0})
+    first = clock()
+
+    steps = int(round(args.duration / args.dt))
+    profiler = Profiler(('controller', 'physics')) if args.profile else None
+    recorder = Recorder(args.record) if args.record is not None else None
+    try:
+        t0 = clock()
+        track = run(ip, pc, steps, args.ratio, args.delay, profiler, recorder)
+        elapsed = clock() - t0
+    finally:
+        if recorder is not None:
+            recorder.close()
+    save(args.output, track)
+    print("import %.3f s, first step at %.3f s" % (imported - START, first - START))
+    # Runs of no steps, or shorter than the resolution of the timer, have no
+    # measurable rate
+    rate = steps / elapsed if elapsed > 0. else 0.
+    print("%d steps in %.3f s (%.1f steps/s)" % (steps, elapsed, rate))
+    if profiler is not None:
+        print(profiler.report())
+        profiler.export(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Numerical integrators for the inverted pendulum. Each integrator advances a
+state ``y = (O, w, x, v)`` by a time ``dt``, given a function ``f(y)`` that
+returns its derivative ``(w, q, v, a)``. The force is held constant by ``f``
+during the whole interval. States can be arrays of shape ``(4,)`` or
+``(4, n)``.
+"""
+# Module level imports
+from __future__ import print_function
+from timeit import default_timer as clock
+from numpy import abs, array, isfinite, maximum, pi
+
+
+def euler(f, y, dt):
+    """
+    Explicit Euler method.
+    """
+    return y + dt * f(y)
+
+
+def semi_implicit_euler(f, y, dt):
+    """
+    Semi-implicit (symplectic) Euler method. Velocities are updated first, and
+    positions are updated with the new velocities.
+    """
+    dy = f(y)
+    y = y.copy()
+    y[1::2] += dt * dy[1::2]
+    y[0::2] += dt * y[1::2]
+    return y
+
+
+def leapfrog(f, y, dt):
+    """
+    Leapfrog (velocity Verlet) method: half a step on the velocities, a full
+    step on the positions and another half step on the velocities, with the
+    accelerations evaluated at the new positions.
+    """
+    y = y.copy()
+    y[1::2] += 0.5 * dt * f(y)[1::2]
+    y[0::2] += dt * y[1::2]
+    y[1::2] += 0.5 * dt * f(y)[1::2]
+    return y
+
+
+def rk4(f, y, dt):
+    """
+    Classical fourth order Runge-Kutta method.
+    """
+    k1 = f(y)
+    k2 = f(y + 0.5 * dt * k1)
+    k3 = f(y + 0.5 * dt * k2)
+    k4 = f(y + dt * k3)
+    return y + dt / 6. * (k1 + 2. * k2 + 2. * k3 + k4)
+
+
+# Dormand-Prince 5(4) coefficients
+_A = [
+    [],
+    [1. / 5.],
+    [3. / 40., 9. / 40.],
+    [44. / 45., -56. / 15., 32. / 9.],
+    [19372. / 6561., -25360. / 2187., 64448. / 6561., -212. / 729.],
+    [9017. / 3168., -355. / 33., 46732. / 5247., 49. / 176., -5103. / 18656.],
+    [35. / 384., 0., 500. / 1113., 125. / 192., -2187. / 6784., 11. / 84.]
+]
+_B = array([35. / 384., 0., 500. / 1113., 125. / 192., -2187. / 6784., 11. / 84., 0.])
+_E = _B - array([5179. / 57600., 0., 7571. / 16695., 393. / 640., -92097. / 339200., 187. / 2100., 1. / 40.])
+
+
+def rk45(f, y, dt, rtol=1e-6, atol=1e-9, h=None):
+    """
+    Adaptive Dormand-Prince 5(4) method. The interval ``dt`` is covered by as
+    many internal steps as needed to keep the local error estimate below
+    ``atol + rtol * |y|``.
+
+    :Parameters:
+      f, y, dt
+        As in the other integrators;
+      rtol, atol
+        Relative and absolute tolerances;
+      h
+        Size of the first internal step. Defaults to ``dt``.
+
+    Raises ``ArithmeticError`` if the error estimate is not finite even for
+    internal steps shorter than ``1e-12 * dt``.
+    """
+    t = 0.
+    h = min(h or dt, dt)
+    hmin = 1e-12 * dt
+    while dt - t > 1e-12 * dt:
+        h = min(h, dt - t)
+        k = [f(y)]
+        for a in _A[1:]:
+            yi = y
+            for aj, kj in zip(a, k):
+                if aj != 0.:
+                    yi = yi + h * aj * kj
+            k.append(f(yi))
+        ynew = y
+        for bj, kj in zip(_B, k):
+            if bj != 0.:
+                ynew = ynew + h * bj * kj
+        error = 0. * y
+        for ej, kj in zip(_E, k):
+            error = error + h * ej * kj
+        scale = atol + rtol * maximum(abs(y), abs(ynew))
+        err = float((abs(error) / scale).max())
+        if not isfinite(err):
+            # Overflow or an invalid state: retry with much shorter steps,
+            # down to a minimum
+            if h <= hmin:
+                raise ArithmeticError("rk45: error estimate is not finite at t = %g" % t)
+            h = max(0.1 * h, hmin)
+            continue
+        if err <= 1.:
+            t += h
+            y = ynew
+        h *= min(5., max(0.2, 0.9 * err ** -0.2)) if err > 0. else 5.
+    return y
+
+
+INTEGRATORS = {
+    'euler': euler,
+    'semi_implicit': semi_implicit_euler,
+    'leapfrog': leapfrog,
+    'rk4': rk4,
+    'rk45': rk45
+}
+
+
+def accuracy_report(duration=5., O=pi / 8., periods=(0.01, 0.02, 0.05), integrators=None):
+    """
+    Compares the integrators against a fine step reference. For each of the
+    given control periods, the reference is the closed loop with the same
+    period and 100 RK4 steps per period, so that only the integration error
+    is measured, not the effect of the control rate. Each integrator is run
+    with one step per control period, and its angle is compared with the
+    reference at the same instants.
+
+    :Returns:
+      A list of tuples ``(integrator, period, error, controller_calls,
+      derivative_calls, seconds)``, where error is the largest absolute
+      difference of the angle, in radians.
+    """
+    # Imported here, since ip itself depends on this module
+    from headless import run
+    from ip import InvertedPendulum, get_controller, principal_value
+
+    def simulate(dt, integrator, substeps=1):
+        ip = InvertedPendulum(dt=dt, integrator=integrator, substeps=substeps)
+        ip.set_state(O, 0., 0., 0.)
+        steps = int(round(duration / dt))
+        t0 = clock()
+        track = run(ip, get_controller(), steps)
+        return track['O'], steps, ip.evaluations, clock() - t0
+
+    refs = dict((dt, simulate(dt, 'rk4', 100)[0]) for dt in periods)
+    rows = []
+    for name in integrators or sorted(INTEGRATORS):
+        for dt in periods:
+            O1, calls, evaluations, seconds = simulate(dt, name)
+            error = float(abs(principal_value(O1 - refs[dt])).max())
+            rows.append((name, dt, error, calls, evaluations, seconds))
+    return rows
+
+
+def main():
+    print("%-14s %7s %12s %9s %9s %9s" % ('integrator', 'period', 'max error', 'control', 'f evals', 'seconds'))
+    for row in accuracy_report():
+        print("%-14s %7.3f %12.3e %9d %9d %9.3f" % row)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,72 @@
 # Module level imports
+import hashlib
+import inspect
+import os
+import sys
 from numpy import *
-from fuzzy.InputVariable import InputVariable
-from fuzzy.OutputVariable import OutputVariable
-from fuzzy.fuzzify.Plain import Plain
-from fuzzy.Adjective import Adjective
 
 # Project level import
-from control import PendulumController
-from mf import flat_saw
+from integrators import INTEGRATORS
+
+g = 9.80665  # Gravity in m/s^2
+
+# Directory where built controllers are kept between runs
+CACHE_DIR = os.environ.get('IP_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'inverted-pendulum'))
+
+# Modules whose classes and functions make up the built controller, and the
+# one of the format it is cached in
+CONTROLLER_MODULES = ('control.py', 'exact.py', 'mf.py', 'storage.py')
+
+# Record of one simulation step: the state before the step and the force
+TRACK_DTYPE = dtype([('O', float64), ('w', float64), ('x', float64), ('v', float64), ('F', float64)])
+
+# Record of one simulation step with its time
+TIMED_DTYPE = dtype([('t', float64)] + TRACK_DTYPE.descr)
+
+
+def principal_value(x):
+    """
+    Principal value of angle x (that is, -pi <= x < pi). Works for scalars and
+    arrays.
+    """
+    return (x + pi) % (2 * pi) - pi
+
+
+def accelerations(O, w, F, l, m, mc):
+    """
+    Angular and linear accelerations of the pendulum. Works for scalars and
+    arrays, which are broadcast against each other.
+
+    :Parameters:
+      O
+        Angular position in radians
+      w
+        Angular velocity in radians/second
+      F
+        Force applied to the cart
+      l, m, mc
+        Pendulum length, pendulum mass and cart mass
+
+    :Returns:
+      A tuple ``(q, a)`` with the angular and the linear accelerations.
+    """
+    so = sin(O)
+    co = cos(O)
+    M = m + mc
+    q = (g * so + (-F - m * l * w * w * so) * co / M) / (l * (4. / 3. - m * co * co / M))
+    a = F - (m * l * (w * w * so - q * co)) / M
+    return q, a
 
 
 class InvertedPendulum(object):
     """
     Dynamic model of an inverted pendulum. It calculates the linear and angular
     accelerations (represented by a and q, respectively). Speed and position
-    are calculated through Euler discretization of the differential equations.
+    are calculated through Euler discretization of the differential equations,
+    unless another integrator is chosen.
     """
 
-    def __init__(self, l=0.5, m=0.1, mc=0.5, dt=0.01):
+    def __init__(self, l=0.5, m=0.1, mc=0.5, dt=0.01, integrator=None, substeps=1, **options):
         """
         Initializes the pendulum.
 
@@ -30,6 +79,8 @@ class InvertedPendulum(object):
             Cart mass (in kilograms)
           dt
             Time delta for simulation (in seconds)
+          integrator, substeps, options
+            Integration method. See ``set_integrator``.
         """
         self.l = l
         self.m = m
@@ -39,12 +90,36 @@ class InvertedPendulum(object):
         self.w = 0.  # Pendulum angular velocity in rad/s
         self.x = 0.  # Cart position in meters
         self.v = 0.  # Cart speed in meters/second
+        self.evaluations = 0  # Number of evaluations of the dynamics
+        self.set_integrator(integrator, substeps, **options)
+
+    def set_integrator(self, integrator=None, substeps=1, **options):
+        """
+        Chooses the integration method. The force is held constant during the
+        whole time delta, whatever the method.
+
+        :Parameters:
+          integrator
+            The name of one of the methods in ``integrators.INTEGRATORS``, or
+            a function with the same signature. If none is given, the built-in
+            semi-implicit Euler step is used;
+          substeps
+            Number of integrator steps in each time delta;
+          options
+            Extra arguments of the integrator, such as the tolerances of
+            ``rk45``.
+        """
+        if isinstance(integrator, str):
+            integrator = INTEGRATORS[integrator]
+        self.integrator = integrator
+        self.substeps = substeps
+        self.options = options
 
     def __pv(self, x):
         """
         Principal value of angle x (that is, -pi <= x < pi)
         """
-        return (x + pi) % (2 * pi) - pi
+        return principal_value(x)
 
     def set_state(self, O=0., w=0., x=0., v=0.):
         """
@@ -85,21 +160,15 @@ class InvertedPendulum(object):
           F
             Force applied to the cart
         """
-        g = 9.80665  # Gravity in m/s^2
-        l = self.l
+        if self.integrator is not None:
+            return self.__integrate(F)
+        self.evaluations += 1
         O = self.O
         w = self.w
         x = self.x
         v = self.v
-        so = sin(O)
-        co = cos(O)
-        m = self.m
-        mc = self.mc
         dt = self.dt
-        M = m + mc
-
-        q = (g * so + (-F - m * l * w * w * so) * co / M) / (l * (4. / 3. - m * co * co / M))
-        a = F - (m * l * (w * w * so - q * co)) / M
+        q, a = accelerations(O, w, F, self.l, self.m, self.mc)
 
         self.w = w + q * dt
         self.O = self.__pv(O + self.w * dt)
@@ -108,8 +177,140 @@ class InvertedPendulum(object):
 
         return self.get_state()
 
+    def __integrate(self, F):
+        l = self.l
+        m = self.m
+        mc = self.mc
+
+        def f(y):
+            self.evaluations += 1
+            q, a = accelerations(y[0], y[1], F, l, m, mc)
+            return array((y[1], q, y[3], a))
+
+        y = array(self.get_state())
+        h = self.dt / self.substeps
+        for i in range(self.substeps):
+            y = self.integrator(f, y, h, **self.options)
+        self.O = self.__pv(float(y[0]))
+        self.w = float(y[1])
+        self.x = float(y[2])
+        self.v = float(y[3])
+        return self.get_state()
+
+
+class BatchPendulum(object):
+    """
+    A batch of ``n`` independent inverted pendulums, advanced together. The
+    states are kept as rows of a contiguous ``(4, n)`` array, and every
+    physical parameter can be given per pendulum.
+    """
+
+    def __init__(self, n, l=0.5, m=0.1, mc=0.5, dt=0.01):
+        """
+        Initializes the pendulums, all of them at rest.
+
+        :Parameters:
+          n
+            Number of pendulums
+          l, m, mc, dt
+            Pendulum length, pendulum mass, cart mass and time delta, as in
+            ``InvertedPendulum``. Each one can be a scalar, shared by every
+            pendulum, or an array with one value per pendulum.
+        """
+        self.n = n
+        self.l = self.__param(l)
+        self.m = self.__param(m)
+        self.mc = self.__param(mc)
+        self.dt = self.__param(dt)
+        self.state = zeros((4, n))
+
+    def __param(self, p):
+        p = asarray(p, dtype=float)
+        if p.ndim == 0:
+            return float(p)
+        if p.shape != (self.n,):
+            raise ValueError("parameter must be a scalar or have one value per pendulum")
+        return ascontiguousarray(p)
+
+    @property
+    def O(self):
+        return self.state[0]
+
+    @property
+    def w(self):
+        return self.state[1]
+
+    @property
+    def x(self):
+        return self.state[2]
+
+    @property
+    def v(self):
+        return self.state[3]
+
+    def set_state(self, O=0., w=0., x=0., v=0.):
+        """
+        Sets the state of the pendulums. Each value can be a scalar or an
+        array with one value per pendulum.
+        """
+        self.state[0] = principal_value(asarray(O, dtype=float))
+        self.state[1] = w
+        self.state[2] = x
+        self.state[3] = v
+
+    def get_state(self):
+        """
+        Get the state of the pendulums, in the form of a tuple of arrays
+        ``(O, w, x, v)``. The arrays are views over the internal state.
+        """
+        return self.O, self.w, self.x, self.v
+
+    def apply(self, F):
+        """
+        Advances every pendulum by one time step, with the same discretization
+        of ``InvertedPendulum.apply``.
+
+        :Parameters:
+          F
+            Force applied to each cart, a scalar or an array.
+        """
+        O, w, x, v = self.state
+        dt = self.dt
+        q, a = accelerations(O, w, F, self.l, self.m, self.mc)
+        w += q * dt
+        O += w * dt
+        O[:] = principal_value(O)
+        v += a * dt
+        x += v * dt
+        return self.get_state()
+
+    def step(self, controller):
+        """
+        Runs one closed loop step: the controller is evaluated for every
+        pendulum in one call and the resulting forces are applied.
+
+        :Parameters:
+          controller
+            A batched controller, such as ``control.ArrayController``, called
+            with a dictionary of arrays of inputs.
+
+        :Returns:
+          The array of applied forces.
+        """
+        F = controller({'O': self.O, 'w': self.w, 'x': self.x, 'v': self.v})
+        self.apply(F)
+        return F
+
 
 def create_controller():
+    # Imported here, so that the pendulum can be used without loading pyfuzzy
+    from fuzzy.InputVariable import InputVariable
+    from fuzzy.OutputVariable import OutputVariable
+    from fuzzy.fuzzify.Plain import Plain
+    from fuzzy.Adjective import Adjective
+    from control import PendulumController
+    from mf import flat_saw
+
     controller = PendulumController()
 
     # Create the membership functions to variable O (inclination of the pendulum).
@@ -183,16 +384,136 @@ def create_controller():
 
     # Decision rules for position and speed of the cart. While this worked, the
     # pendulum ended up very unstable.
+    # add_cart_table(controller)
+
+    return controller
+
+
+def add_cart_table(controller):
+    """
+    Adds the decision rules for the position and speed of the cart to a
+    controller of ``create_controller``. Each line of the table is an
+    adjective of x, and each column one of v.
+    """
+    x_names = ['xn', 'xz', 'xp']
+    v_names = ['vn', 'vz', 'vp']
     table_names = [
         ['Fbp', 'Fbp', 'Fz'],
         ['Fbp', 'Fz', 'Fbn'],
         ['Fz', 'Fbn', 'Fbn']
     ]
-    # controller.add_table([controller.variables['x'].adjectives[name] for name in x_names],
-    #                  [controller.variables['v'].adjectives[name] for name in v_names],
-    #                  [[controller.variables['F'].adjectives[name] for name in row] for row in table_names])
+    controller.add_table([controller.variables['x'].adjectives[name] for name in x_names],
+                         [controller.variables['v'].adjectives[name] for name in v_names],
+                         [[controller.variables['F'].adjectives[name] for name in row] for row in table_names])
+
 
+def package_version(module, distribution):
+    """
+    Version of an installed package, from its ``__version__`` or else from
+    the metadata of its distribution. Packages found in neither are told
+    apart by their location.
+    """
+    version = getattr(module, '__version__', None)
+    if version is None:
+        try:
+            import pkg_resources
+            version = pkg_resources.get_distribution(distribution).version
+        except Exception:  # pkg_resources or the metadata are missing
+            version = os.path.dirname(os.path.abspath(module.__file__))
+    return str(version)
+
+
+def controller_key():
+    """
+    Hash of the definition of the controller: the source of
+    ``create_controller``, of the modules its objects come from and of the
+    format it is cached in, and the Python, numpy and pyfuzzy versions the
+    cached controller was built with.
+    """
+    import numpy
+    import fuzzy
+    digest = hashlib.sha1()
+    digest.update(inspect.getsource(create_controller).encode('utf-8'))
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in CONTROLLER_MODULES:
+        with open(os.path.join(here, name), 'rb') as f:
+            digest.update(f.read())
+    digest.update(sys.version.encode('utf-8'))
+    digest.update(package_version(numpy, 'numpy').encode('utf-8'))
+    digest.update(package_version(fuzzy, 'pyfuzzy').encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_controller(cache_dir=CACHE_DIR):
+    """
+    Returns the controller of ``create_controller``.
+
+    :Parameters:
+      cache_dir
+        Directory where the built controller is cached, keyed by
+        ``controller_key``. A controller built with the same definition is
+        loaded from it instead of being built again. If None, the controller
+        is always built.
+
+    The controller is cached as a spec of ``storage.py``, plain arrays read
+    without unpickling, since the cache directory may be writable by others.
+    """
+    # Imported here, since storage is only needed for the cache
+    import storage
+
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, 'controller-%s.npz' % controller_key())
+        try:
+            return storage.to_controller(storage.load(path))
+        except Exception:  # Missing or unreadable, built again below
+            pass
+    controller = create_controller()
+    if cache_dir is not None:
+        # Written under a temporary name and renamed, so that processes
+        # starting together never read a partial file
+        temp = '%s.%d' % (path, os.getpid())
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with open(temp, 'wb') as f:
+                storage.save(f, storage.from_controller(controller))
+            os.rename(temp, path)
+        except (IOError, OSError):
+            pass
     return controller
 
 
-PC = create_controller()
\ No newline at end of file
+# Controller shared by the application, see get_controller
+_controller = None
+
+
+def get_controller():
+    """
+    Returns the controller shared by the application. It is loaded or built
+    on first use, so importing this module does not pay for it.
+    """
+    global _controller
+    if _controller is None:
+        _controller = load_controller()
+    return _controller
+
+
+class SharedController(object):
+    """
+    Stand-in for the controller of ``get_controller``, which forwards calls
+    and attributes to it, so that it is only loaded when first used.
+    """
+
+    def __call__(self, *args, **keywords):
+        return get_controller()(*args, **keywords)
+
+    def __getattr__(self, name):
+        return getattr(get_controller(), name)
+
+    def __setattr__(self, name, value):
+        setattr(get_controller(), name, value)
+
+
+# Controller shared by the application, kept for the code that uses it by
+# this name
+PC = SharedController()
@@ -1,4 +1,5 @@
 # Module level imports
+from timeit import default_timer as clock
 from fuzzy.norm.Min import Min
 from fuzzy.norm.AlgebraicProduct import AlgebraicProduct
 from fuzzy.norm.EinsteinProduct import EinsteinProduct
@@ -8,6 +9,11 @@ from fuzzy.defuzzify.MaxRight import MaxRight
 
 # Project level imports
 from ip import *
+from worker import SimulationWorker
+from control import ArrayController, breakpoint_matrix
+from exact import ExactCOG, ExactMaxLeft, ExactMaxRight
+from mf import memberships
+from recorder import Recording
 from qtip import *
 from plot import *
 
@@ -24,12 +30,21 @@ class ControlFrame(QGroupBox):
         self.go_button = QPushButton("Start", self)
         self.stop_button = QPushButton("Stop", self)
         self.step_button = QPushButton("Step", self)
+        self.speed_combo = QComboBox(self)
+        self.speed_combo.addItems(["Real Time", "2x Real Time", "10x Real Time", "As Fast As Possible"])
+        self.steps_label = QLabel("Steps/Frame:")
+        self.steps_spin = QSpinBox(self)
+        self.steps_spin.setRange(1, 10000)
+        self.steps_spin.setValue(10)
 
         layout = QVBoxLayout(self)
         layout.setSpacing(0)
         layout.addWidget(self.go_button, Qt.AlignLeft)
         layout.addWidget(self.stop_button, Qt.AlignLeft)
         layout.addWidget(self.step_button, Qt.AlignLeft)
+        layout.addWidget(self.speed_combo, Qt.AlignLeft)
+        layout.addWidget(self.steps_label, Qt.AlignLeft)
+        layout.addWidget(self.steps_spin, Qt.AlignLeft)
 
         self.enable()
         self.show()
@@ -38,11 +53,22 @@ class ControlFrame(QGroupBox):
         self.go_button.setEnabled(True)
         self.stop_button.setEnabled(False)
         self.step_button.setEnabled(True)
+        self.speed_combo.setEnabled(True)
+        self.steps_spin.setEnabled(True)
 
     def disable(self):
         self.go_button.setEnabled(False)
         self.stop_button.setEnabled(True)
         self.step_button.setEnabled(False)
+        self.speed_combo.setEnabled(False)
+        self.steps_spin.setEnabled(False)
+
+    def get_speed(self):
+        """
+        Returns the simulation speed as a multiple of real time, or None to
+        run as fast as possible.
+        """
+        return [1., 2., 10., None][self.speed_combo.currentIndex()]
 
 
 class RedefineFrame(QGroupBox):
@@ -125,14 +151,33 @@ class ConfigFrame(QGroupBox):
         self.defuzzy_combo = QComboBox(self)
         self.defuzzy_combo.addItems(["Center Of Gravity",
                                      "Left Global Maximum",
-                                     "Right Global Maximum"])
+                                     "Right Global Maximum",
+                                     "Exact Center Of Gravity",
+                                     "Exact Left Global Maximum",
+                                     "Exact Right Global Maximum"])
+        self.engine_check = QCheckBox("Rule Matrix", self)
+        self.table_check = QCheckBox("Lookup Table", self)
+        self.error_label = QLabel("")
+        self.ratio_label = QLabel("Control Ratio:")
+        self.ratio_spin = QSpinBox(self)
+        self.ratio_spin.setRange(1, 50)
+        self.delay_label = QLabel("Sensor Delay:")
+        self.delay_spin = QSpinBox(self)
+        self.delay_spin.setRange(0, 50)
 
         layout = QGridLayout(self)
         layout.setSpacing(0)
         layout.addWidget(self.logic_label, 0, 0)
         layout.addWidget(self.logic_combo, 0, 1)
+        layout.addWidget(self.engine_check, 1, 0)
         layout.addWidget(self.defuzzy_label, 2, 0)
         layout.addWidget(self.defuzzy_combo, 2, 1)
+        layout.addWidget(self.table_check, 3, 0)
+        layout.addWidget(self.error_label, 3, 1)
+        layout.addWidget(self.ratio_label, 4, 0)
+        layout.addWidget(self.ratio_spin, 4, 1)
+        layout.addWidget(self.delay_label, 5, 0)
+        layout.addWidget(self.delay_spin, 5, 1)
 
         self.enable()
         self.show()
@@ -140,10 +185,120 @@ class ConfigFrame(QGroupBox):
     def enable(self):
         self.logic_combo.setEnabled(True)
         self.defuzzy_combo.setEnabled(True)
+        self.engine_check.setEnabled(True)
+        self.table_check.setEnabled(True)
+        self.ratio_spin.setEnabled(True)
+        self.delay_spin.setEnabled(True)
 
     def disable(self):
         self.logic_combo.setEnabled(False)
         self.defuzzy_combo.setEnabled(False)
+        self.engine_check.setEnabled(False)
+        self.table_check.setEnabled(False)
+        self.ratio_spin.setEnabled(False)
+        self.delay_spin.setEnabled(False)
+
+    def set_error(self, error):
+        if error is None:
+            self.error_label.setText("")
+        else:
+            self.error_label.setText("Error: %7.4f" % error)
+
+
+class StatsFrame(QGroupBox):
+    """
+    This frame shows the timings of each phase of the simulation, when
+    profiling is enabled, and exports them.
+    """
+
+    def __init__(self, *cnf):
+        QGroupBox.__init__(self, *cnf)
+
+        self.setTitle("Profiling:")
+        self.profile_check = QCheckBox("Enabled", self)
+        self.export_button = QPushButton("Export...", self)
+        self.stats_label = QLabel("")
+        self.stats_label.setFont(QFont("Monospace", 8))
+        self.stats_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+
+        layout = QGridLayout(self)
+        layout.setSpacing(0)
+        layout.addWidget(self.profile_check, 0, 0)
+        layout.addWidget(self.export_button, 0, 1)
+        layout.addWidget(self.stats_label, 1, 0, 1, 2)
+
+        self.show()
+
+    def set_stats(self, profiler):
+        self.stats_label.setText(profiler.report())
+
+
+class ReplayFrame(QGroupBox):
+    """
+    This frame shows the controls to play back a recorded trajectory.
+    """
+
+    SLIDER_STEPS = 100000  # Positions of the slider along the recording
+
+    def __init__(self, *cnf):
+        QGroupBox.__init__(self, *cnf)
+
+        self.setTitle("Replay:")
+        self.open_button = QPushButton("Open...", self)
+        self.live_button = QPushButton("Live", self)
+        self.play_button = QPushButton("Play", self)
+        self.pause_button = QPushButton("Pause", self)
+        self.speed_label = QLabel("Speed:")
+        self.speed_spin = QDoubleSpinBox(self)
+        self.speed_spin.setRange(0.01, 1000.)
+        self.speed_spin.setValue(1.)
+        self.speed_spin.setSuffix("x")
+        self.position_slider = QSlider(Qt.Horizontal, self)
+        self.position_slider.setRange(0, self.SLIDER_STEPS)
+        self.time_label = QLabel("")
+
+        layout = QGridLayout(self)
+        layout.setSpacing(0)
+        layout.addWidget(self.open_button, 0, 0)
+        layout.addWidget(self.live_button, 0, 1)
+        layout.addWidget(self.play_button, 1, 0)
+        layout.addWidget(self.pause_button, 1, 1)
+        layout.addWidget(self.speed_label, 2, 0)
+        layout.addWidget(self.speed_spin, 2, 1)
+        layout.addWidget(self.position_slider, 3, 0, 1, 2)
+        layout.addWidget(self.time_label, 4, 0, 1, 2)
+
+        self.loaded = False
+        self.enable()
+        self.show()
+
+    def enable(self):
+        self.open_button.setEnabled(True)
+        self.live_button.setEnabled(self.loaded)
+        self.play_button.setEnabled(self.loaded)
+        self.pause_button.setEnabled(self.loaded)
+        self.speed_spin.setEnabled(self.loaded)
+        self.position_slider.setEnabled(self.loaded)
+
+    def disable(self):
+        self.open_button.setEnabled(False)
+        self.live_button.setEnabled(False)
+        self.play_button.setEnabled(False)
+        self.pause_button.setEnabled(False)
+        self.speed_spin.setEnabled(False)
+        self.position_slider.setEnabled(False)
+
+    def set_loaded(self, loaded):
+        self.loaded = loaded
+        if not loaded:
+            self.time_label.setText("")
+        self.enable()
+
+    def set_position(self, T, duration, norm, defuzzy):
+        self.position_slider.blockSignals(True)
+        self.position_slider.setValue(int(self.SLIDER_STEPS * T / duration) if duration > 0 else 0)
+        self.position_slider.blockSignals(False)
+        self.time_label.setText("%.2f / %.2f s (%s, %s)" % (T, duration, norm, defuzzy))
 
 
 class IPFrame(QFrame):
@@ -158,18 +313,20 @@ class IPFrame(QFrame):
         m = 0.1
         mc = 0.5
         dt = 0.01
-        self.ip = InvertedPendulum(l, m, mc, dt)
-        self.pc = PC
+        window = 2.5  # Seconds of trajectory shown in the plots
+        self.pc = get_controller()
+        self.worker = SimulationWorker(InvertedPendulum(l, m, mc, dt), self.pc, window)
+        self.track = self.worker.track
         self.running = False
+        self.fps = 30.  # Maximum number of frames rendered per second
+        self.version = -1  # Last publication of the worker rendered
+        self.timer = QTimer(self)
         self.Orange = linspace(-3. * pi / 8., 3. * pi / 8., 100)
         self.wrange = linspace(-9. * pi / 2., 9. * pi / 2., 100)
         self.Frange = linspace(-100, 100, 500)
         self.F = 0.
-        self.Otrack = []
-        self.wtrack = []
-        self.xtrack = []
-        self.vtrack = []
-        self.Ftrack = []
+        self.engine = ArrayController.from_controller(self.pc)  # Output sets shown in the Membership tab
+        self.mcache = {}  # Breakpoints of the membership curves drawn, by variable
 
         # Frame Inicialization
         QFrame.__init__(self, *cnf)
@@ -179,9 +336,20 @@ class IPFrame(QFrame):
         # Graphic Elements
         self.ipview = PendulumView(l, m)
         self.graph = PlotWindow(5)
+        self.graph.set_curve_axis(4, Qwt.QwtPlot.yRight)  # Force, in newtons
+        for i in range(5):
+            self.graph.set_curve_window(i, self.track.size)
+        self.plotted = (-1, 0)  # Reset count and number of records plotted
         self.ctrl_frame = ControlFrame(self)
         self.redef_frame = RedefineFrame(self)
         self.config_frame = ConfigFrame(self)
+        self.stats_frame = StatsFrame(self)
+        self.profiler = None  # The profiler of the worker, while profiling
+        self.stats_time = 0.  # Last update of the stats frame
+        self.replay_frame = ReplayFrame(self)
+        self.recording = None  # The recording played back, if any
+        self.replay_T = 0.  # Position of the playback in the recording timeline
+        self.replay_clock = None  # Clock of the last playback advance, None while paused
 
         # Plots
         self.gframe = QFrame(self)
@@ -227,15 +395,18 @@ class IPFrame(QFrame):
         self.tabs.addTab(self.gframe, 'Membership')
 
         layout = QGridLayout(self)
-        layout.addWidget(self.tabs, 0, 0, 5, 1)
+        layout.addWidget(self.tabs, 0, 0, 6, 1)
         layout.addWidget(self.ctrl_frame, 0, 1)
         layout.addWidget(self.redef_frame, 1, 1)
         layout.addWidget(self.config_frame, 2, 1)
+        layout.addWidget(self.stats_frame, 3, 1)
+        layout.addWidget(self.replay_frame, 4, 1)
         layout.setRowStretch(0, 0)
         layout.setRowStretch(1, 0)
         layout.setRowStretch(2, 0)
         layout.setRowStretch(3, 0)
-        layout.setRowStretch(4, 1)
+        layout.setRowStretch(4, 0)
+        layout.setRowStretch(5, 1)
         layout.setColumnStretch(0, 1)
         layout.setColumnStretch(1, 0)
         self.feedback(O=0., w=0., x=0., v=0., F=0.)
@@ -247,168 +418,330 @@ class IPFrame(QFrame):
         self.connect(self.redef_frame.redef_button, SIGNAL("clicked()"), self.on_redef_button)
         self.connect(self.config_frame.logic_combo, SIGNAL("currentIndexChanged(int)"), self.on_logic_combo)
         self.connect(self.config_frame.defuzzy_combo, SIGNAL("currentIndexChanged(int)"), self.on_defuzzy_combo)
+        self.connect(self.config_frame.engine_check, SIGNAL("toggled(bool)"), self.on_engine_check)
+        self.connect(self.config_frame.table_check, SIGNAL("toggled(bool)"), self.on_table_check)
+        self.connect(self.config_frame.ratio_spin, SIGNAL("valueChanged(int)"), self.on_ratio_spin)
+        self.connect(self.config_frame.delay_spin, SIGNAL("valueChanged(int)"), self.on_delay_spin)
+        self.connect(self.stats_frame.profile_check, SIGNAL("toggled(bool)"), self.on_profile_check)
+        self.connect(self.stats_frame.export_button, SIGNAL("clicked()"), self.on_export_button)
+        self.connect(self.replay_frame.open_button, SIGNAL("clicked()"), self.on_open_button)
+        self.connect(self.replay_frame.live_button, SIGNAL("clicked()"), self.on_live_button)
+        self.connect(self.replay_frame.play_button, SIGNAL("clicked()"), self.on_play_button)
+        self.connect(self.replay_frame.pause_button, SIGNAL("clicked()"), self.on_pause_button)
+        self.connect(self.replay_frame.position_slider, SIGNAL("valueChanged(int)"), self.on_position_slider)
         self.connect(self.tabs, SIGNAL("currentChanged(int)"), self.on_change_tab)
+        self.connect(self.timer, SIGNAL("timeout()"), self.on_timer)
 
         # Exibe o frame
+        self.worker.start()
         self.set_state(pi / 8., 0., 0., 0., 0.)
+        self.timer.start(int(1000. / self.fps))
         self.show()
 
     def enable(self):
         self.ctrl_frame.enable()
         self.redef_frame.enable()
         self.config_frame.enable()
+        self.replay_frame.enable()
 
     def disable(self):
         self.ctrl_frame.disable()
         self.redef_frame.disable()
         self.config_frame.disable()
+        self.replay_frame.disable()
+
+    def __draw_memberships(self, graph, variable, names, x, first):
+        """
+        Plots the membership functions of the given adjectives of a variable,
+        from the curve ``first`` on. All the curves are computed in a single
+        pass, and only when the adjectives changed since the last call.
+        """
+        adjectives = self.pc.variables[variable].adjectives
+        adjs = [(name, [p[0] for p in adjectives[name].set.points], [p[1] for p in adjectives[name].set.points])
+                for name in names]
+        if self.mcache.get(variable) == adjs:
+            return
+        self.mcache[variable] = adjs
+        X, Y = breakpoint_matrix(adjs)
+        M = memberships(X, Y, x)
+        for j in range(len(names)):
+            graph.setData(first + j, x, M[:, j])
 
     def __draw_O(self):
-        x = self.Orange
-        self.Ograph.set_multi_data([
-            (x, map(self.pc.variables['O'].adjectives['Ovbn'].set,x)),
-            (x, map(self.pc.variables['O'].adjectives['Obn'].set, x)),
-            (x, map(self.pc.variables['O'].adjectives['Osn'].set, x)),
-            (x, map(self.pc.variables['O'].adjectives['Oz'].set, x)),
-            (x, map(self.pc.variables['O'].adjectives['Osp'].set, x)),
-            (x, map(self.pc.variables['O'].adjectives['Obp'].set, x)),
-            (x, map(self.pc.variables['O'].adjectives['Ovbp'].set, x)),
-            ([0.], [0.])
-        ])
+        self.__draw_memberships(self.Ograph, 'O', ['Ovbn', 'Obn', 'Osn', 'Oz', 'Osp', 'Obp', 'Ovbp'],
+                                self.Orange, 0)
+        self.Ograph.setData(7, [0.], [0.])
 
     def __draw_w(self):
-        x = self.wrange
-        self.wgraph.set_multi_data([
-            (x, map(self.pc.variables['w'].adjectives['wbn'].set, x)),
-            (x, map(self.pc.variables['w'].adjectives['wsn'].set, x)),
-            (x, map(self.pc.variables['w'].adjectives['wz'].set, x)),
-            (x, map(self.pc.variables['w'].adjectives['wsp'].set, x)),
-            (x, map(self.pc.variables['w'].adjectives['wbp'].set, x)),
-            ([0.], [0.])
-        ])
+        self.__draw_memberships(self.wgraph, 'w', ['wbn', 'wsn', 'wz', 'wsp', 'wbp'], self.wrange, 0)
+        self.wgraph.setData(5, [0.], [0.])
 
     def __draw_F(self):
-        x = self.Frange
-        self.Fgraph.set_multi_data([
-            ([0.], [0.]),
-            ([0.], [0.]),
-            ([0., 0.], [-0.025, -0.1]),
-            (x, map(self.pc.variables['F'].adjectives['Fvvbn'].set, x)),
-            (x, map(self.pc.variables['F'].adjectives['Fvbn'].set, x)),
-            (x, map(self.pc.variables['F'].adjectives['Fbn'].set, x)),
-            (x, map(self.pc.variables['F'].adjectives['Fsn'].set, x)),
-            (x, map(self.pc.variables['F'].adjectives['Fz'].set, x)),
-            (x, map(self.pc.variables['F'].adjectives['Fsp'].set, x)),
-            (x, map(self.pc.variables['F'].adjectives['Fbp'].set, x)),
-            (x, map(self.pc.variables['F'].adjectives['Fvbp'].set, x)),
-            (x, map(self.pc.variables['F'].adjectives['Fvvbp'].set, x))
-        ])
+        self.Fgraph.setData(0, [0.], [0.])
+        self.Fgraph.setData(1, [0.], [0.])
+        self.Fgraph.setData(2, [0., 0.], [-0.025, -0.1])
+        self.__draw_memberships(self.Fgraph, 'F', ['Fvvbn', 'Fvbn', 'Fbn', 'Fsn', 'Fz', 'Fsp', 'Fbp', 'Fvbp', 'Fvvbp'],
+                                self.Frange, 3)
+
+    def __draw_output(self, O, w):
+        """
+        Plots the output set for the given inputs: the aggregated set in
+        curve 0 and the activated set of the strongest adjective in curve 1.
+        Only these curves change; the membership functions are not redrawn.
+        """
+        engine = self.engine
+        M = engine.memberships({'O': array([O]), 'w': array([w])})
+        alpha = engine.activate(engine.fire(M))
+        k = alpha[0].argmax()
+        self.Fgraph.setData(0, engine.y, engine.aggregate(alpha)[0])
+        self.Fgraph.setData(1, engine.y, minimum(engine.sets[k], alpha[0, k]))
 
     def set_state(self, O, w, x, v, F):
-        self.Otrack = [O]
-        self.wtrack = [w]
-        self.xtrack = [x]
-        self.vtrack = [v]
-        self.Ftrack = [F]
-        self.ip.set_state(O, w, x, v)
-        self.feedback(O, w, x, v, F)
-
-    def feedback(self, O, w, x, v, F):
+        self.worker.send('reset', O, w, x, v, F)
+
+    def feedback(self, O, w, x, v, F, measured=None):
+        """
+        Shows a state of the pendulum and the force applied to it. The
+        Membership tab shows the inference of the force, from the state
+        ``measured`` by the controller, ``(O, w)``, which defaults to the
+        state shown.
+        """
+        profiler = self.profiler
         ci = self.tabs.currentIndex()
         if ci == 0:  # Pendulum
-            self.ipview.set_state(O, w, x, v, F)
+            if profiler is None:
+                self.ipview.set_state(O, w, x, v, F)
+            else:
+                profiler.call('view', self.ipview.set_state, O, w, x, v, F)
         elif ci == 1:  # Plots
-            t = arange(0., 2.5, self.ip.dt)
-            self.graph.set_multi_data([
-                (t, self.Otrack), (t, self.wtrack),
-                (t, self.xtrack), (t, self.vtrack),
-                (t, zeros(t.shape))  # self.Ftrack)
-            ])
+            if profiler is None:
+                self.__draw_track()
+            else:
+                profiler.call('plot', self.__draw_track)
         elif ci == 2:  # Membership
-            self.Ograph.setData(-1, [O, O], [0., 1.])
-            self.wgraph.setData(-1, [w, w], [0., 1.])
+            Om, wm = (O, w) if measured is None else measured
+            self.Ograph.setData(-1, [Om, Om], [0., 1.])
+            self.wgraph.setData(-1, [wm, wm], [0., 1.])
             self.Fgraph.setData(2, [F, F], [-0.025, -0.1])
+            self.__draw_output(Om, wm)
         self.redef_frame.feedback(O, w, x, v, F)
 
-    def step(self):
-        O, w, x, v = self.ip.get_state()
-        F = self.pc({'O': O, 'w': w}, {'F': 0.0})
-        self.ip.apply(F)
-        self.feedback(O, w, x, v, F)
-        self.Otrack.append(O)
-        self.wtrack.append(w)
-        self.xtrack.append(x)
-        self.vtrack.append(v)
-        self.Ftrack.append(F)
+    def __draw_track(self):
+        """
+        Appends to the plots the records of the trajectory added since the
+        last call.
+        """
+        if self.recording is not None:
+            self.__draw_recording()
+            return
+        with self.worker.lock:
+            resets = self.worker.resets
+            total = self.track.total
+            if resets != self.plotted[0]:
+                self.graph.clear()
+                new = total
+            else:
+                new = total - self.plotted[1]
+            self.plotted = (resets, total)
+            track = self.track.view()
+            new = min(new, len(track))
+            if new == 0:
+                return
+            track = track[len(track) - new:]
+            t = track['t']
+            for i, name in enumerate(('O', 'w', 'x', 'v', 'F')):
+                self.graph.append(i, t, track[name])
+
+    def __draw_recording(self):
+        """
+        Plots the records of the recording played back up to the current one,
+        within its segment and as many as the plots of the simulation hold.
+        """
+        i = self.recording.seek(self.replay_T)
+        start = max(int(self.recording.segment(i)['start']), i + 1 - self.track.size)
+        records = self.recording[start:i + 1]
+        self.graph.clear()
+        t = records['t']
+        for k, name in enumerate(('O', 'w', 'x', 'v', 'F')):
+            self.graph.append(k, t, records[name])
+        self.plotted = (-1, 0)  # The simulation is plotted again from scratch
+
+    def render(self):
+        if self.recording is not None:
+            record = self.recording[self.recording.seek(self.replay_T)]
+            O, w, x, v, F = [record[name] for name in ('O', 'w', 'x', 'v', 'F')]
+            measured = None
+            self.replay_frame.set_position(self.replay_T, self.recording.duration(),
+                                           self.recording.norms[record['norm']],
+                                           self.recording.defuzzifiers[record['defuzzy']])
+        else:
+            state = self.worker.snapshot()
+            O, w, x, v, F = [state[name] for name in ('O', 'w', 'x', 'v', 'F')]
+            # The force was computed from the measured state, not from the
+            # state it led to
+            measured = (state['Om'], state['wm'])
+            self.config_frame.set_error(self.worker.error)
+        self.feedback(O, w, x, v, F, measured)
+        if self.profiler is not None and clock() - self.stats_time > 0.5:
+            self.stats_time = clock()
+            self.stats_frame.set_stats(self.profiler)
+
+    def on_timer(self):
+        """
+        Renders the latest state published by the worker, if it changed, or
+        advances the playback of a recording.
+        """
+        if self.recording is not None:
+            if self.replay_clock is not None:
+                now = clock()
+                self.replay_T += (now - self.replay_clock) * self.replay_frame.speed_spin.value()
+                self.replay_clock = now
+                duration = self.recording.duration()
+                if self.replay_T >= duration:
+                    self.replay_T = duration
+                    self.replay_clock = None
+                self.render()
+            return
+        version = self.worker.version
+        if version == self.version:
+            return
+        self.version = version
+        self.render()
 
     def on_go_button(self):
         self.disable()
         self.running = True
-        while self.running:
-            self.step()
-            self.app.processEvents()
-        self.enable()
+        self.worker.send('speed', self.ctrl_frame.get_speed(), self.ctrl_frame.steps_spin.value())
+        self.worker.send('start')
 
     def on_stop_button(self):
         self.running = False
+        self.worker.send('stop')
+        self.enable()
 
     def on_step_button(self):
         if self.running:
             return
-        self.step()
+        self.worker.send('step')
 
     def on_redef_button(self):
         if self.running:
             return
         O, w, x, v = self.redef_frame.get_values()
-        self.Otrack = []
-        self.wtrack = []
-        self.xtrack = []
-        self.vtrack = []
-        self.Ftrack = []
         self.set_state(O, w, x, v, 0)
 
     def on_logic_combo(self, index):
         if index == 0:
-            self.pc.set_norm(Min)
+            self.worker.send('norm', Min)
+            self.engine.set_norm(Min)
         elif index == 1:
-            self.pc.set_norm(AlgebraicProduct)
+            self.worker.send('norm', AlgebraicProduct)
+            self.engine.set_norm(AlgebraicProduct)
         elif index == 2:
-            self.pc.set_norm(EinsteinProduct)
+            self.worker.send('norm', EinsteinProduct)
+            self.engine.set_norm(EinsteinProduct)
 
     def on_defuzzy_combo(self, index):
         if index == 0:     # Center Of Gravity
-            self.pc.set_defuzzy(COG)
+            self.worker.send('defuzzy', COG)
+            self.engine.set_defuzzy(COG)
         elif index == 1:   # Left Global Maximum
-            self.pc.set_defuzzy(MaxLeft)
+            self.worker.send('defuzzy', MaxLeft)
+            self.engine.set_defuzzy(MaxLeft)
         elif index == 2:   # Right Global Maximum
-            self.pc.set_defuzzy(MaxRight)
+            self.worker.send('defuzzy', MaxRight)
+            self.engine.set_defuzzy(MaxRight)
+        elif index == 3:   # Exact Center Of Gravity
+            self.worker.send('defuzzy', ExactCOG)
+            self.engine.set_defuzzy(ExactCOG)
+        elif index == 4:   # Exact Left Global Maximum
+            self.worker.send('defuzzy', ExactMaxLeft)
+            self.engine.set_defuzzy(ExactMaxLeft)
+        elif index == 5:   # Exact Right Global Maximum
+            self.worker.send('defuzzy', ExactMaxRight)
+            self.engine.set_defuzzy(ExactMaxRight)
+
+    def on_engine_check(self, checked):
+        self.worker.send('engine', checked)
+
+    def on_table_check(self, checked):
+        self.worker.send('table', checked)
+
+    def on_ratio_spin(self, value):
+        self.worker.send('ratio', value)
+
+    def on_delay_spin(self, value):
+        self.worker.send('delay', value)
+
+    def on_profile_check(self, checked):
+        self.profiler = self.worker.profiler if checked else None
+        self.graph.profiler = self.profiler
+        self.worker.send('profile', checked)
+        self.stats_frame.set_stats(self.worker.profiler)
+
+    def on_export_button(self):
+        path = QFileDialog.getSaveFileName(self, "Export Timings", "timings.json", "JSON (*.json)")
+        if path:
+            self.worker.profiler.export(str(path))
+
+    def on_open_button(self):
+        path = QFileDialog.getExistingDirectory(self, "Open Recording")
+        if path:
+            self.open_recording(str(path))
+
+    def open_recording(self, path):
+        """
+        Plays back the recording in the directory ``path`` instead of the
+        simulation. Neither the controller nor the pendulum run meanwhile.
+        """
+        recording = Recording(path)
+        if len(recording) == 0:
+            QMessageBox.warning(self, "Replay", "The recording is empty.")
+            return
+        recording.index()
+        self.on_stop_button()
+        self.recording = recording
+        self.replay_T = 0.
+        self.replay_clock = None
+        self.ctrl_frame.disable()
+        self.ctrl_frame.stop_button.setEnabled(False)
+        self.redef_frame.disable()
+        self.config_frame.disable()
+        self.replay_frame.set_loaded(True)
+        self.render()
+
+    def on_live_button(self):
+        self.recording = None
+        self.replay_clock = None
+        self.replay_frame.set_loaded(False)
+        self.enable()
+        self.plotted = (-1, 0)
+        self.render()
+
+    def on_play_button(self):
+        if self.replay_T >= self.recording.duration():
+            self.replay_T = 0.
+        self.replay_clock = clock()
+
+    def on_pause_button(self):
+        self.replay_clock = None
+
+    def on_position_slider(self, value):
+        self.replay_T = self.recording.duration() * value / float(ReplayFrame.SLIDER_STEPS)
+        self.render()
 
     def on_change_tab(self, index):
-        if index == 0:  # Pendulum
-            O = self.Otrack[-1]
-            w = self.wtrack[-1]
-            x = self.xtrack[-1]
-            v = self.vtrack[-1]
-            F = self.Ftrack[-1]
-            self.ipview.set_state(O, w, x, v, F)
-        elif index == 1:  # Plots
-            t = arange(0., 2.5, self.ip.dt)
-            self.graph.set_multi_data([
-                (t, self.Otrack), (t, self.wtrack),
-                (t, self.xtrack), (t, self.vtrack),
-                (t, zeros(t.shape))  # self.Ftrack)
-            ])
-        elif index == 2:  # Membership
-            O = self.Otrack[-1]
-            w = self.wtrack[-1]
-            x = self.xtrack[-1]
-            v = self.vtrack[-1]
-            F = self.Ftrack[-1]
-            self.feedback(O, w, x, v, F)
+        if index == 2:  # Membership
+            self.__draw_O()
+            self.__draw_w()
+            self.__draw_F()
+        self.render()
 
     def closeEvent(self, event):
         self.on_stop_button()
+        self.timer.stop()
+        self.worker.send('quit')
+        self.worker.join()
         self.app.exit(0)
 
 
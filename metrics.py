@@ -0,0 +1,64 @@
+"""
+Stability metrics of simulated trajectories.
+"""
+# Module level imports
+from numpy import abs, flatnonzero, inf, pi
+
+# Angle below which the pendulum is considered settled, in radians
+SETTLE_ANGLE = pi / 180.
+
+# Angle above which the pendulum is considered fallen, in radians
+FALL_ANGLE = pi / 2.
+
+
+def settling_time(O, dt, tolerance=SETTLE_ANGLE):
+    """
+    Time after which the angle stays inside ``[-tolerance, tolerance]`` up to
+    the end of the trajectory.
+
+    :Parameters:
+      O
+        Array of angular positions, one per step;
+      dt
+        Time delta between steps, in seconds;
+      tolerance
+        Largest absolute angle considered settled, in radians.
+
+    :Returns:
+      The settling time in seconds, or ``inf`` if the pendulum does not settle.
+    """
+    outside = flatnonzero(abs(O) > tolerance)
+    if len(outside) == 0:
+        return 0.
+    if outside[-1] == len(O) - 1:
+        return inf
+    return (outside[-1] + 1) * dt
+
+
+def stability(track, dt):
+    """
+    Computes the stability metrics of a trajectory.
+
+    :Parameters:
+      track
+        Array of ``ip.TRACK_DTYPE`` records;
+      dt
+        Time delta between steps, in seconds.
+
+    :Returns:
+      A tuple ``(settling_time, max_angle, drift, effort)``, with the settling
+      time in seconds, the largest absolute angle in radians, the largest
+      displacement of the cart from its initial position in meters and the
+      control effort, the integral of the squared force.
+
+    Raises ``ValueError`` on an empty trajectory, which has no metrics.
+    """
+    if len(track) == 0:
+        raise ValueError("stability metrics of an empty trajectory")
+    O = track['O']
+    x = track['x']
+    F = track['F']
+    return (settling_time(O, dt),
+            float(abs(O).max()),
+            float(abs(x - x[0]).max()),
+            float((F * F).sum() * dt))
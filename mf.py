@@ -1,9 +1,87 @@
+# Module level imports
 from fuzzy.set.Polygon import Polygon
+from numpy import array, clip, interp, linspace, newaxis, where
 
 
-def saw(interval, n):
+class PiecewiseLinear(Polygon):
     """
-    Splits an ``interval`` into ``n`` triangle functions.
+    Piecewise linear membership function with its breakpoints kept as arrays.
+    It evaluates numbers or whole arrays with ``numpy.interp``, and it is a
+    pyfuzzy ``Polygon``, so it can be used as the set of an ``Adjective``.
+    """
+
+    # Bumped whenever the breakpoints of any function are edited, so that the
+    # compiled forms built from them know that they are stale
+    revision = 0
+
+    def __init__(self, xp=(), fp=()):
+        """
+        Creates the function.
+
+        :Parameters:
+          xp
+            Horizontal coordinates of the breakpoints, in increasing order;
+          fp
+            Membership values at the breakpoints.
+        """
+        Polygon.__init__(self)
+        for x, y in zip(xp, fp):
+            Polygon.add(self, x=float(x), y=float(y))
+        self.__update()
+
+    def __update(self):
+        self.xp = array([p[0] for p in self.points], dtype=float)
+        self.fp = array([p[1] for p in self.points], dtype=float)
+
+    def add(self, *args, **keywords):
+        Polygon.add(self, *args, **keywords)
+        self.__update()
+        PiecewiseLinear.revision += 1
+
+    def remove(self, *args, **keywords):
+        Polygon.remove(self, *args, **keywords)
+        self.__update()
+        PiecewiseLinear.revision += 1
+
+    def clear(self):
+        Polygon.clear(self)
+        self.__update()
+        PiecewiseLinear.revision += 1
+
+    def __call__(self, x):
+        return interp(x, self.xp, self.fp)
+
+
+def memberships(X, Y, u):
+    """
+    Evaluates a family of piecewise linear functions, all with ``k``
+    breakpoints, in a single vectorized operation.
+
+    :Parameters:
+      X
+        An ``(n, k)`` matrix with the horizontal coordinates of the
+        breakpoints of each function, in increasing order along each line;
+      Y
+        An ``(n, k)`` matrix with the membership values at the breakpoints;
+      u
+        An array of ``N`` values.
+
+    :Returns:
+      An ``(N, n)`` matrix with the membership of each value to each function.
+      Outside of the breakpoints, the functions keep their end values.
+    """
+    u = array(u, dtype=float, ndmin=1)[:, newaxis, newaxis]
+    dx = X[:, 1:] - X[:, :-1]
+    dy = Y[:, 1:] - Y[:, :-1]
+    flat = dx == 0.
+    t = clip((u - X[:, :-1]) / where(flat, 1., dx), 0., 1.)
+    t = where(flat, u >= X[:, :-1], t)
+    return Y[:, 0] + (t * dy).sum(axis=2)
+
+
+def saw_matrix(interval, n):
+    """
+    Breakpoints of ``n`` triangle functions splitting an ``interval``.
 
     :Parameters:
       interval
@@ -13,52 +91,82 @@ def saw(interval, n):
         The number of functions in which the interval must be split.
 
     :Returns:
-      A list of triangle membership functions, in order.
+      A tuple ``(X, Y)`` of ``(n, 3)`` matrices, with the horizontal
+      coordinates and the membership values of the breakpoints of each
+      function, in order.
     """
     xo, xf = interval
     dx = float(xf - xo) / float(n + 1)
-    mfs = []
-    for i in range(n):
-        mft = Polygon()
-        mft.add(x=xo, y=0.0)
-        mft.add(x=xo + dx, y=1.0)
-        mft.add(x=xo + 2 * dx, y=0.0)
-        mfs.append(mft)
-        xo += dx
-    return mfs
+    starts = xo + dx * linspace(0., n - 1, n)
+    X = array([starts, starts + dx, starts + 2 * dx]).T
+    Y = array([[0.0, 1.0, 0.0]] * n).reshape(n, 3)
+    return X, Y
 
 
-def flat_saw(interval, n):
+def flat_saw_matrix(interval, n):
     """
-    Splits an ``interval`` into a decreasing ramp, ``n-2`` triangle functions
-    and an increasing ramp.
+    Breakpoints of a decreasing ramp, ``n-2`` triangle functions and an
+    increasing ramp splitting an ``interval``.
 
     :Parameters:
       interval
         A tuple containing the start and the end of the interval, in the format
         ``(start, end)``;
       n
-        The number of functions in which the interval must be split.
+        The number of functions in which the interval must be split, at
+        least 2.
 
     :Returns:
-      A list of corresponding functions, in order.
+      A tuple ``(X, Y)`` of ``(n, 3)`` matrices, as in ``saw_matrix``.
     """
+    if n < 2:
+        raise ValueError("flat_saw needs at least 2 functions, got %d" % n)
     xo, xf = interval
     dx = float(xf - xo) / float(n + 1)
+    X, Y = saw_matrix(interval, n)
 
     # Decreasing ramp
-    mf1 = Polygon()
-    mf1.add(x=xo, y=1.0)
-    mf1.add(x=xo + dx, y=1.0)
-    mf1.add(x=xo + 2 * dx, y=0.0)
-
-    # ``n-2`` triangle
-    mfs = saw((xo + dx, xf - dx), n - 2)
+    X[0] = [xo, xo + dx, xo + 2 * dx]
+    Y[0] = [1.0, 1.0, 0.0]
 
     # Increasing ramp
-    mf2 = Polygon()
-    mf2.add(x=xf - 2 * dx, y=0.0)
-    mf2.add(x=xf - dx, y=1.0)
-    mf2.add(x=xf, y=1.0)
+    X[-1] = [xf - 2 * dx, xf - dx, xf]
+    Y[-1] = [0.0, 1.0, 1.0]
+
+    return X, Y
+
 
-    return [mf1] + mfs + [mf2]
+def saw(interval, n):
+    """
+    Splits an ``interval`` into ``n`` triangle functions.
+
+    :Parameters:
+      interval
+        A tuple containing the start and the end of the interval, in the format
+        ``(start, end)``;
+      n
+        The number of functions in which the interval must be split.
+
+    :Returns:
+      A list of triangle membership functions, in order.
+    """
+    return [PiecewiseLinear(x, y) for x, y in zip(*saw_matrix(interval, n))]
+
+
+def flat_saw(interval, n):
+    """
+    Splits an ``interval`` into a decreasing ramp, ``n-2`` triangle functions
+    and an increasing ramp.
+
+    :Parameters:
+      interval
+        A tuple containing the start and the end of the interval, in the format
+        ``(start, end)``;
+      n
+        The number of functions in which the interval must be split, at
+        least 2.
+
+    :Returns:
+      A list of corresponding functions, in order.
+    """
+    return [PiecewiseLinear(x, y) for x, y in zip(*flat_saw_matrix(interval, n))]
@@ -1,12 +1,43 @@
 # Module level imports
 import PyQt4.Qwt5 as Qwt
 
+from timeit import default_timer as clock
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from PyQt4.Qt import QEvent
 from numpy import *
 
 
+def minmax_downsample(x, y, buckets):
+    """
+    Reduces a curve to the minimum and the maximum of each of ``buckets``
+    groups of consecutive points, keeping them in their original order. The
+    envelope of the curve is preserved when there are more points than pixels.
+
+    :Parameters:
+      x
+        Horizontal coordinates, in increasing order;
+      y
+        Vertical coordinates;
+      buckets
+        Number of groups.
+
+    :Returns:
+      A tuple ``(x, y)`` with at most ``2 * buckets + 1`` points.
+    """
+    n = len(x)
+    k = n // buckets
+    if k < 2:
+        return x, y
+    m = buckets * k
+    yb = y[:m].reshape(buckets, k)
+    base = arange(buckets) * k
+    imin = base + yb.argmin(axis=1)
+    imax = base + yb.argmax(axis=1)
+    index = unique(concatenate((imin, imax, arange(m, n))))
+    return x[index], y[index]
+
+
 class PlotWindow(Qwt.QwtPlot):
     def __init__(self, nplots, *args):
         """
@@ -33,6 +64,19 @@ class PlotWindow(Qwt.QwtPlot):
             new_curve.setRenderHint(Qwt.QwtPlotItem.RenderAntialiased)
             self.__curves.append(new_curve)
 
+        # Data of each curve, in the format [x, y, n, window], where x and y
+        # are preallocated for curves with a window
+        self.__data = [[zeros(0), zeros(0), 0, None] for i in xrange(nplots)]
+        self.__dirty = set()
+
+        # Replots are coalesced and done at most max_fps times per second
+        self.max_fps = 30.
+        self.__last_replot = 0.
+        self.__timer = QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.connect(self.__timer, SIGNAL("timeout()"), self.flush)
+        self.profiler = None  # Times the replots under 'replot' if set
+
     def set_curve_color(self, i, color):
         """
         Sets the color of a given plot.
@@ -57,6 +101,65 @@ class PlotWindow(Qwt.QwtPlot):
         """
         self.__curves[i].setBrush(brush)
 
+    def set_curve_axis(self, i, axis):
+        """
+        Attaches a given plot to a vertical axis (``Qwt.QwtPlot.yLeft`` or
+        ``Qwt.QwtPlot.yRight``), enabling the axis.
+        """
+        self.__curves[i].setYAxis(axis)
+        self.enableAxis(axis)
+
+    def set_curve_window(self, i, window):
+        """
+        Preallocates a given plot for ``append``, keeping only its last
+        ``window`` points. The current data is discarded.
+        """
+        i %= self.__nplots
+        self.__data[i] = [zeros(2 * window), zeros(2 * window), 0, window]
+        self.__dirty.add(i)
+
+    def append(self, i, x, y):
+        """
+        Appends points to a given plot, without copying the previous ones.
+        The plot must have a window (see ``set_curve_window``).
+
+        :Parameters:
+          i
+            Number of the plot;
+          x
+            Horizontal coordinates, a number or an array;
+          y
+            Vertical coordinates, with the same shape of ``x``.
+        """
+        i %= self.__nplots
+        data = self.__data[i]
+        xb, yb, n, window = data
+        if window is None:
+            raise ValueError("plot has no window")
+        x = atleast_1d(x)[-window:]
+        y = atleast_1d(y)[-window:]
+        k = len(x)
+        if n + k > 2 * window:
+            # Moves the last points to the front, amortized O(1) per point
+            keep = window - k
+            xb[:keep] = xb[n - keep:n]
+            yb[:keep] = yb[n - keep:n]
+            n = keep
+        xb[n:n + k] = x
+        yb[n:n + k] = y
+        data[2] = n + k
+        self.__dirty.add(i)
+        self.request_replot()
+
+    def clear(self, i=None):
+        """
+        Removes the points of a given plot, or of every plot.
+        """
+        for j in (xrange(self.__nplots) if i is None else [i % self.__nplots]):
+            self.__data[j][2] = 0
+            self.__dirty.add(j)
+        self.request_replot()
+
     def setData(self, i, x, y):
         """
         Plots the x, y data in the ith plot.
@@ -69,10 +172,12 @@ class PlotWindow(Qwt.QwtPlot):
           y
             Vertical coordinates
         """
-        x = array(x)
-        y = array(y)
-        self.__curves[i].setData(x, y)
-        self.replot()
+        i %= self.__nplots
+        x = asarray(x, dtype=float)
+        y = asarray(y, dtype=float)
+        self.__data[i] = [x, y, len(x), None]
+        self.__dirty.add(i)
+        self.request_replot()
 
     def set_multi_data(self, xy):
         """
@@ -87,7 +192,44 @@ class PlotWindow(Qwt.QwtPlot):
         if n != self.__nplots:
             raise ValueError, "data and plots not equal"
         for i in xrange(n):
-            x = array(xy[i][0])
-            y = array(xy[i][1])
+            x = asarray(xy[i][0], dtype=float)
+            y = asarray(xy[i][1], dtype=float)
+            self.__data[i] = [x, y, len(x), None]
+            self.__dirty.add(i)
+        self.request_replot()
+
+    def request_replot(self):
+        """
+        Schedules a replot, so that many updates in a short time are drawn
+        only once. With ``max_fps`` set to None, replots immediately.
+        """
+        if self.max_fps is None:
+            self.flush()
+        elif not self.__timer.isActive():
+            wait = self.__last_replot + 1. / self.max_fps - clock()
+            self.__timer.start(max(0, int(1000. * wait)))
+
+    def flush(self):
+        """
+        Hands the pending data to the curves and replots. Curves with more
+        points than the canvas has pixels are downsampled to their minimum
+        and maximum per pixel.
+        """
+        if self.profiler is not None:
+            t0 = clock()
+        self.__timer.stop()
+        width = max(self.canvas().width(), 1)
+        for i in self.__dirty:
+            x, y, n, window = self.__data[i]
+            if window is not None:
+                x = x[max(0, n - window):n]
+                y = y[max(0, n - window):n]
+                n = len(x)
+            if n > 2 * width:
+                x, y = minmax_downsample(x, y, width)
             self.__curves[i].setData(x, y)
+        self.__dirty.clear()
+        self.__last_replot = clock()
         self.replot()
+        if self.profiler is not None:
+            self.profiler.phase('replot').add(clock() - t0)
@@ -0,0 +1,130 @@
+"""
+Timing of the phases of the simulation loop. Each phase keeps its latest
+latencies in a ring of samples, from which the percentiles are computed on
+demand, and counters over the whole run.
+
+Code that can be profiled holds a ``profiler`` attribute that is None while
+profiling is disabled, so the only cost is then the test of that attribute.
+"""
+# Module level imports
+from __future__ import print_function
+import json
+from timeit import default_timer as clock
+from numpy import percentile, zeros
+
+
+class Phase(object):
+    """
+    Latencies of one phase.
+    """
+
+    def __init__(self, size=4096):
+        """
+        Creates the phase.
+
+        :Parameters:
+          size
+            Number of latest samples kept for the percentiles.
+        """
+        self.samples = zeros(size)
+        self.clear()
+
+    def clear(self):
+        self.samples[:] = 0.
+        self.count = 0
+        self.total = 0.
+        self.peak = 0.
+
+    def add(self, seconds):
+        """
+        Records one latency, in seconds.
+        """
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+        self.total += seconds
+        if seconds > self.peak:
+            self.peak = seconds
+
+    def stats(self):
+        """
+        Returns a dictionary with the ``count`` of samples and the ``total``
+        time since the last clear, the ``p50``, ``p99`` and ``max`` latencies
+        of the latest samples and the ``peak`` latency since the last clear,
+        all in seconds.
+        """
+        count = self.count
+        samples = self.samples[:min(count, len(self.samples))].copy()
+        if len(samples) == 0:
+            return {'count': 0, 'total': 0., 'p50': 0., 'p99': 0., 'max': 0., 'peak': 0.}
+        p50, p99 = percentile(samples, (50., 99.))
+        return {'count': count, 'total': self.total, 'p50': float(p50), 'p99': float(p99),
+                'max': float(samples.max()), 'peak': self.peak}
+
+
+class Profiler(object):
+    """
+    Set of named phases.
+    """
+
+    def __init__(self, phases=(), size=4096):
+        """
+        Creates the profiler.
+
+        :Parameters:
+          phases
+            Names of the phases created up front. Phases timed from more than
+            one thread should be listed here;
+          size
+            Number of latest samples kept by each phase.
+        """
+        self.size = size
+        self.phases = dict((name, Phase(size)) for name in phases)
+        self.names = list(phases)
+
+    def phase(self, name):
+        """
+        Returns the phase with the given name, creating it on first use.
+        """
+        if name not in self.phases:
+            self.phases[name] = Phase(self.size)
+            self.names.append(name)
+        return self.phases[name]
+
+    def call(self, name, f, *args):
+        """
+        Calls ``f`` with the given arguments, recording its latency under the
+        phase ``name``, and returns its result.
+        """
+        t0 = clock()
+        result = f(*args)
+        self.phase(name).add(clock() - t0)
+        return result
+
+    def clear(self):
+        for phase in self.phases.values():
+            phase.clear()
+
+    def stats(self):
+        """
+        Returns the statistics of every phase, by name. See ``Phase.stats``.
+        """
+        return dict((name, self.phases[name].stats()) for name in self.names)
+
+    def report(self):
+        """
+        Returns the statistics as a text table, in microseconds.
+        """
+        lines = ["%-10s %8s %9s %9s %9s" % ("phase", "count", "p50 us", "p99 us", "max us")]
+        stats = self.stats()
+        for name in self.names:
+            s = stats[name]
+            lines.append("%-10s %8d %9.1f %9.1f %9.1f" %
+                         (name, s['count'], 1e6 * s['p50'], 1e6 * s['p99'], 1e6 * s['max']))
+        return "\n".join(lines)
+
+    def export(self, path):
+        """
+        Writes the statistics to ``path`` as JSON, in seconds.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.stats(), f, indent=2, sort_keys=True)
@@ -0,0 +1,340 @@
+"""
+Recording of trajectories to disk. Records are streamed into a directory of
+preallocated chunk files, each one a small header followed by a fixed number
+of records, written through memory maps of the region being written only.
+Memory use is bounded by the write buffer, whatever the length of the run.
+
+The directory holds a ``meta.json`` file with the record type and the names
+behind the norm and defuzzification codes, and the chunks, named
+``chunk-000000.bin`` and so on. A chunk header is the magic string, the
+capacity and the number of records written, as little-endian 64-bit
+integers, padded to ``HEADER_SIZE`` bytes.
+"""
+# Module level imports
+import json
+import os
+import struct
+from numpy import abs, array, concatenate, dtype, empty, flatnonzero, int32, int64, float64, load, maximum, \
+    memmap, save, searchsorted, uint8, zeros
+
+# Project level imports
+from ip import TIMED_DTYPE
+
+# One record: the time and the state reached after a step, the force applied
+# in the step, the norm and defuzzification method in use, as indices into the
+# sorted names of the tables of the recorder, and the number of the trajectory,
+# for batches of them
+RECORD_DTYPE = dtype(TIMED_DTYPE.descr + [('norm', uint8), ('defuzzy', uint8), ('run', int32)])
+
+# One segment of the index of a recording: a run of ``count`` records from
+# ``start`` with times ``t0 + i * dt``, placed at ``T`` in the playback
+# timeline, where segments follow each other
+SEGMENT_DTYPE = dtype([('start', int64), ('count', int64), ('t0', float64), ('dt', float64), ('T', float64)])
+
+MAGIC = b'IPTRACK1'
+HEADER = struct.Struct('<8sQQ')
+HEADER_SIZE = 64
+
+
+def codes(table):
+    """
+    Returns the names of a table of norms or defuzzification methods in the
+    order of their codes, and a dictionary mapping each value to its code.
+    """
+    names = sorted(table)
+    return names, dict((table[name], i) for i, name in enumerate(names))
+
+
+class Recorder(object):
+    """
+    Writer of a recording.
+    """
+
+    def __init__(self, path, chunk=1 << 20, buffer=4096, norms=None, defuzzifiers=None):
+        """
+        Creates the recording. The directory is created if needed, and must
+        not hold another recording.
+
+        :Parameters:
+          path
+            The directory of the recording;
+          chunk
+            Number of records in each chunk file;
+          buffer
+            Number of records gathered in memory before they are written;
+          norms, defuzzifiers
+            Tables of the norms and defuzzification methods that can be
+            recorded, by name. Default to ``control.NORMS`` and
+            ``control.DEFUZZIFIERS``.
+        """
+        if norms is None or defuzzifiers is None:
+            # Imported here, so that recordings can be read without pyfuzzy
+            from control import DEFUZZIFIERS, NORMS
+            norms = NORMS if norms is None else norms
+            defuzzifiers = DEFUZZIFIERS if defuzzifiers is None else defuzzifiers
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            raise ValueError("a recording already exists in %s" % path)
+        self.path = path
+        self.chunk = chunk
+        self.norms, self.norm_codes = codes(norms)
+        self.defuzzifiers, self.defuzzy_codes = codes(defuzzifiers)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'version': 1, 'dtype': RECORD_DTYPE.descr, 'chunk': chunk,
+                       'norms': self.norms, 'defuzzifiers': self.defuzzifiers}, f, indent=2)
+        self.buffer = zeros(buffer, dtype=RECORD_DTYPE)
+        self.buffered = 0
+        self.total = 0  # Records written to the chunks
+        self.__file = None
+        self.__count = 0  # Records in the current chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.total + self.buffered
+
+    def extend(self, track, norm, defuzzy, run=0):
+        """
+        Appends records.
+
+        :Parameters:
+          track
+            Array of records with at least the fields of ``ip.TIMED_DTYPE``;
+          norm, defuzzy
+            The norm and defuzzification method in use, as in
+            ``PendulumController.set_norm`` and ``set_defuzzy``;
+          run
+            Number of the trajectory, or an array with one for each record.
+        """
+        n = len(track)
+        if n >= len(self.buffer):
+            self.flush()
+            records = empty(n, dtype=RECORD_DTYPE)
+            self.__fill(records, track, norm, defuzzy, run)
+            self.__write(records)
+            return
+        if self.buffered + n > len(self.buffer):
+            self.flush()
+        self.__fill(self.buffer[self.buffered:self.buffered + n], track, norm, defuzzy, run)
+        self.buffered += n
+
+    def __fill(self, records, track, norm, defuzzy, run):
+        for name in TIMED_DTYPE.names:
+            records[name] = track[name]
+        records['norm'] = self.norm_codes[norm]
+        records['defuzzy'] = self.defuzzy_codes[defuzzy]
+        records['run'] = run
+
+    def flush(self):
+        """
+        Writes the buffered records to the chunks.
+        """
+        if self.buffered > 0:
+            self.__write(self.buffer[:self.buffered])
+            self.buffered = 0
+
+    def __write(self, records):
+        itemsize = RECORD_DTYPE.itemsize
+        while len(records) > 0:
+            if self.__file is None or self.__count == self.chunk:
+                self.__open()
+            n = min(len(records), self.chunk - self.__count)
+            window = memmap(self.__file, RECORD_DTYPE, 'r+', HEADER_SIZE + self.__count * itemsize, (n,))
+            window[:] = records[:n]
+            del window
+            self.__count += n
+            self.total += n
+            self.__file.seek(0)
+            self.__file.write(HEADER.pack(MAGIC, self.chunk, self.__count))
+            self.__file.flush()
+            records = records[n:]
+
+    def __open(self):
+        """
+        Closes the current chunk and creates the next one, preallocated.
+        """
+        if self.__file is not None:
+            self.__file.close()
+        name = os.path.join(self.path, 'chunk-%06d.bin' % (self.total // self.chunk))
+        self.__file = open(name, 'w+b')
+        self.__file.write(HEADER.pack(MAGIC, self.chunk, 0))
+        self.__file.truncate(HEADER_SIZE + self.chunk * RECORD_DTYPE.itemsize)
+        self.__file.flush()
+        self.__count = 0
+
+    def close(self):
+        self.flush()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+class Recording(object):
+    """
+    Reader of a recording. Records are read straight from memory maps of the
+    chunks, so only the pages accessed are loaded.
+
+    For playback, the recording is split into segments of evenly spaced
+    times; a new one starts wherever the step changes, as when the
+    simulation is reset. The segments are laid end to end in a timeline,
+    where ``seek`` finds the record at any time with arithmetic only. The
+    index of segments is built on first use and saved as ``index.npy``.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.path = path
+        self.dtype = dtype([tuple(field) for field in meta['dtype']])
+        self.chunk = meta['chunk']
+        self.norms = meta['norms']
+        self.defuzzifiers = meta['defuzzifiers']
+        self.chunks = []
+        i = 0
+        while os.path.exists(os.path.join(path, 'chunk-%06d.bin' % i)):
+            name = os.path.join(path, 'chunk-%06d.bin' % i)
+            with open(name, 'rb') as f:
+                magic, capacity, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or capacity != self.chunk:
+                raise ValueError("not a chunk of this recording: %s" % name)
+            if count > 0:
+                self.chunks.append(memmap(name, self.dtype, 'r', HEADER_SIZE, (count,)))
+            i += 1
+        self.total = sum(len(c) for c in self.chunks)
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        """
+        Returns the record at an index, or a copy of the records of a slice.
+        Every chunk but the last is full, so the chunk of a record is found by
+        division.
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.total)
+            if step != 1:
+                raise ValueError("slices of a recording must be contiguous")
+            out = empty(max(stop - start, 0), dtype=self.dtype)
+            i = start
+            while i < stop:
+                c, offset = divmod(i, self.chunk)
+                n = min(stop - i, len(self.chunks[c]) - offset)
+                out[i - start:i - start + n] = self.chunks[c][offset:offset + n]
+                i += n
+            return out
+        if index < 0:
+            index += self.total
+        if not 0 <= index < self.total:
+            raise IndexError("record index out of range")
+        c, offset = divmod(index, self.chunk)
+        return self.chunks[c][offset]
+
+    def index(self):
+        """
+        Returns the segments of the recording, an array of ``SEGMENT_DTYPE``.
+        """
+        if getattr(self, 'segments', None) is not None:
+            return self.segments
+        name = os.path.join(self.path, 'index.npy')
+        try:
+            segments = load(name)
+            if segments['count'].sum() == self.total:
+                self.segments = segments
+                return segments
+        except (IOError, OSError, ValueError):
+            pass
+        self.segments = self.__build_index()
+        try:
+            save(name, self.segments)
+        except (IOError, OSError):
+            pass  # Read-only recordings are indexed on every open
+        return self.segments
+
+    def __build_index(self):
+        # Positions j where the step t[j + 1] - t[j] differs from the one
+        # before, and where it goes back in time, found chunk by chunk so that
+        # only one time column is read at a time
+        changes = []
+        backwards = []
+        base = 0
+        last_t = last_d = None
+        for chunk in self.chunks:
+            t = array(chunk['t'])
+            if last_t is not None:
+                t = concatenate(([last_t], t))
+            d = t[1:] - t[:-1]
+            first = base - 1 if last_t is not None else 0  # Position of d[0]
+            if last_d is not None:
+                d = concatenate(([last_d], d))
+                first -= 1
+            if len(d) > 1:
+                differ = abs(d[1:] - d[:-1]) > 1e-6 * maximum(abs(d[1:]), abs(d[:-1]))
+                changes.append(flatnonzero(differ) + first + 1)
+                backwards.append(flatnonzero(d[1:] < 0.) + first + 1)
+            elif len(d) == 1 and d[0] < 0.:
+                backwards.append(array([first]))
+            if len(d) > 0:
+                last_d = d[-1]
+            last_t = t[-1]
+            base += len(chunk)
+
+        # A segment ends at a change of step, unless it only has one record,
+        # whose step does not matter, and always before going back in time
+        bounds = []
+        s = 0
+        back = set(concatenate(backwards)) if backwards else set()
+        for j in sorted(set(concatenate(changes)) | back if changes else back):
+            if j > s or (j == s and j in back):
+                bounds.append((s, j + 1))
+                s = j + 1
+        if s < self.total:
+            bounds.append((s, self.total))
+        segments = zeros(len(bounds), dtype=SEGMENT_DTYPE)
+        T = 0.
+        for k, (start, stop) in enumerate(bounds):
+            t0 = self[start]['t']
+            dt = self[start + 1]['t'] - t0 if stop - start > 1 else 0.
+            segments[k] = (start, stop - start, t0, dt, T)
+            T += (stop - start) * max(dt, 0.)
+        return segments
+
+    def duration(self):
+        """
+        Returns the length of the playback timeline.
+        """
+        segments = self.index()
+        if len(segments) == 0:
+            return 0.
+        last = segments[-1]
+        return last['T'] + last['count'] * max(last['dt'], 0.)
+
+    def seek(self, T):
+        """
+        Returns the index of the record at the time ``T`` of the timeline.
+        """
+        segments = self.index()
+        k = max(searchsorted(segments['T'], T, 'right') - 1, 0)
+        start, count, _, dt, T0 = segments[k]
+        if dt <= 0.:
+            return int(start)
+        return int(start + min(max(int((T - T0) / dt), 0), count - 1))
+
+    def segment(self, i):
+        """
+        Returns the segment holding the record ``i``.
+        """
+        segments = self.index()
+        return segments[searchsorted(segments['start'], i, 'right') - 1]
+
+    def timeline(self, i):
+        """
+        Returns the time of the record ``i`` in the timeline.
+        """
+        start, _, _, dt, T0 = self.segment(i)
+        return T0 + (i - start) * max(dt, 0.)
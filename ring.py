@@ -0,0 +1,84 @@
+# Module level imports
+from numpy import zeros
+
+
+class RingBuffer(object):
+    """
+    Fixed size buffer of records, which keeps only the most recent ones.
+    Every record is written twice, at positions ``i`` and ``i + size`` of the
+    underlying array, so the records in the buffer are always a contiguous
+    slice of it and can be read without copying.
+    """
+
+    def __init__(self, size, dtype):
+        """
+        Allocates the buffer.
+
+        :Parameters:
+          size
+            Maximum number of records kept;
+          dtype
+            Data type of the records, usually a structured one.
+        """
+        self.size = size
+        self.dtype = dtype
+        self.__data = zeros(2 * size, dtype=dtype)
+        self.__pos = 0
+        self.__count = 0
+        self.total = 0  # Number of records appended since the last clear
+
+    def __len__(self):
+        return self.__count
+
+    def clear(self):
+        """
+        Removes every record.
+        """
+        self.__pos = 0
+        self.__count = 0
+        self.total = 0
+
+    def append(self, record):
+        """
+        Appends a record, discarding the oldest one if the buffer is full.
+        """
+        pos = self.__pos
+        self.__data[pos] = record
+        self.__data[pos + self.size] = record
+        self.__pos = (pos + 1) % self.size
+        if self.__count < self.size:
+            self.__count += 1
+        self.total += 1
+
+    def extend(self, records):
+        """
+        Appends an array of records. Only the last ``size`` of them are kept,
+        but all of them are counted in ``total``.
+        """
+        self.total += len(records)
+        records = records[-self.size:]
+        n = len(records)
+        pos = self.__pos
+        first = min(n, self.size - pos)
+        for offset in (0, self.size):
+            self.__data[offset + pos:offset + pos + first] = records[:first]
+            self.__data[offset:offset + n - first] = records[first:]
+        self.__pos = (pos + n) % self.size
+        self.__count = min(self.__count + n, self.size)
+
+    def view(self):
+        """
+        Returns the records in the buffer, from the oldest to the newest, as a
+        view over the internal storage. It is only valid until the next
+        append.
+        """
+        end = self.__pos + self.size
+        return self.__data[end - self.__count:end]
+
+    def last(self):
+        """
+        Returns the newest record.
+        """
+        if self.__count == 0:
+            raise IndexError("empty buffer")
+        return self.__data[self.__pos + self.size - 1]
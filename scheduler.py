@@ -0,0 +1,142 @@
+"""
+Multi-rate closed loop: the plant is advanced at its own time step, while the
+controller is sampled at a lower rate and its output is held between samples
+(zero-order hold). The measurements seen by the controller can be delayed.
+"""
+# Module level imports
+from __future__ import print_function
+import argparse
+from collections import deque
+from numpy import empty, pi
+
+# Project level imports
+from control import NORMS, DEFUZZIFIERS
+from metrics import stability
+
+
+class MultiRate(object):
+    """
+    Scheduler of a closed loop where the controller runs every ``ratio``
+    physics steps.
+    """
+
+    def __init__(self, ip, pc, ratio=1, delay=0, profiler=None):
+        """
+        Creates the scheduler.
+
+        :Parameters:
+          ip
+            The inverted pendulum. Its time delta is the physics step;
+          pc
+            The controller;
+          ratio
+            Number of physics steps in each control period;
+          delay
+            Sensor delay, in physics steps. The controller receives the state
+            measured this many steps before the current one;
+          profiler
+            A ``profiler.Profiler`` timing the ``controller`` and ``physics``
+            phases of each step, or None.
+        """
+        self.ip = ip
+        self.pc = pc
+        self.ratio = ratio
+        self.delay = delay
+        self.profiler = profiler
+        self.reset()
+
+    def reset(self, F=0.):
+        """
+        Restarts the control period, holding the force ``F`` until the next
+        sample. Must be called whenever the state of the pendulum is set.
+        """
+        self.F = F
+        self.count = 0
+        self.history = deque(maxlen=self.delay + 1)
+        self.measured = self.ip.get_state()  # State the force was computed from
+
+    def step(self):
+        """
+        Advances one physics step, sampling the controller if a control
+        period has started.
+
+        :Returns:
+          A tuple ``(O, w, x, v, F)`` with the state before the step and the
+          force applied in it.
+        """
+        profiler = self.profiler
+        O, w, x, v = state = self.ip.get_state()
+        self.history.append(state)
+        if self.count == 0:
+            Om, wm, xm, vm = self.measured = self.history[0]
+            measured = {'O': Om, 'w': wm, 'x': xm, 'v': vm}
+            if profiler is None:
+                self.F = self.pc(measured, {'F': 0.0})
+            else:
+                self.F = profiler.call('controller', self.pc, measured, {'F': 0.0})
+        self.count = (self.count + 1) % self.ratio
+        if profiler is None:
+            self.ip.apply(self.F)
+        else:
+            profiler.call('physics', self.ip.apply, self.F)
+        return O, w, x, v, self.F
+
+    def run(self, steps, track):
+        """
+        Advances ``steps`` physics steps, writing each ``(O, w, x, v, F)``
+        into consecutive records of ``track``, an array of
+        ``ip.TRACK_DTYPE``.
+        """
+        for i in range(steps):
+            track[i] = self.step()
+        return track
+
+
+def rate_report(ratios=(1, 2, 5, 10), delays=(0,), O=pi / 8., duration=10., dt=0.01,
+                norm='min', defuzzy='cog'):
+    """
+    Simulates the closed loop for each control ratio and sensor delay.
+
+    :Returns:
+      A list of tuples ``(ratio, delay, controller_calls, settling_time,
+      max_angle, drift, effort)``.
+    """
+    # Imported here, so that the scheduler can be used without building PC
+    from ip import InvertedPendulum, get_controller, TRACK_DTYPE
+
+    PC = get_controller()
+    PC.set_norm(NORMS[norm])
+    PC.set_defuzzy(DEFUZZIFIERS[defuzzy])
+    steps = int(round(duration / dt))
+    rows = []
+    for ratio in ratios:
+        for delay in delays:
+            ip = InvertedPendulum(dt=dt)
+            ip.set_state(O, 0., 0., 0.)
+            track = MultiRate(ip, PC, ratio, delay).run(steps, empty(steps, dtype=TRACK_DTYPE))
+            calls = (steps + ratio - 1) // ratio
+            rows.append((ratio, delay, calls) + stability(track, dt))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reports how the control rate affects stability.")
+    parser.add_argument('--ratio', nargs='+', type=int, default=[1, 2, 5, 10],
+                        help="physics steps per control period")
+    parser.add_argument('--delay', nargs='+', type=int, default=[0], help="sensor delays, in physics steps")
+    parser.add_argument('--theta', type=float, default=22.5, help="initial angle, in degrees")
+    parser.add_argument('--duration', type=float, default=10.)
+    parser.add_argument('--dt', type=float, default=0.01, help="physics time step, in s")
+    parser.add_argument('--norm', choices=sorted(NORMS), default='min')
+    parser.add_argument('--defuzzy', choices=sorted(DEFUZZIFIERS), default='cog')
+    args = parser.parse_args(argv)
+
+    rows = rate_report(args.ratio, args.delay, args.theta * pi / 180., args.duration, args.dt,
+                       args.norm, args.defuzzy)
+    print("%6s %6s %8s %10s %10s %10s %10s" % ('ratio', 'delay', 'calls', 'settling', 'max |O|', 'drift', 'effort'))
+    for row in rows:
+        print("%6d %6d %8d %10.3f %10.4f %10.4f %10.2f" % row)
+
+
+if __name__ == "__main__":
+    main()
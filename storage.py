@@ -0,0 +1,212 @@
+"""
+Compact on-disk format of fuzzy controllers, written with ``numpy.savez``.
+A controller is stored as a handful of arrays:
+
+  ``variables``, ``outputs``
+    Names of the variables, and whether each one is an output;
+  ``adjectives``, ``owner``, ``sizes``
+    Names of the adjectives, the index of the variable of each one and the
+    number of breakpoints of its membership function;
+  ``X``, ``Y``
+    ``(A, k)`` breakpoints of the membership functions, padded as in
+    ``control.breakpoint_matrix``;
+  ``antecedents``, ``consequents``
+    ``(R, m)`` adjective indices joined by the norm in each rule, and the
+    adjective index of its consequent;
+  ``norm``, ``defuzzy``
+    Keys of ``control.NORMS`` and ``control.DEFUZZIFIERS``.
+
+Loading a file gives these arrays in a dictionary, called a spec, from which
+``to_engine`` builds an ``ArrayController`` without creating pyfuzzy objects,
+and ``to_controller`` builds a ``PendulumController``. Banks hold many
+variants of one controller, with the same variables and adjectives, stacked
+in a single file.
+"""
+# Module level imports
+from __future__ import print_function
+import argparse
+from numpy import array, asarray, load as load_arrays, savez, savez_compressed, stack, zeros
+
+# pyfuzzy and the control module are imported by the functions that need them,
+# so that specs can be saved, loaded and stacked without pyfuzzy
+
+FORMAT_VERSION = 1
+
+# Arrays that are the same for every variant of a bank, and the ones stacked
+SHARED = ('variables', 'outputs', 'adjectives', 'owner', 'sizes')
+STACKED = ('X', 'Y', 'antecedents', 'consequents', 'norm', 'defuzzy')
+
+
+def key_of(table, value):
+    """
+    Returns the name of a norm or defuzzification method in ``table``.
+    """
+    for key, item in table.items():
+        if item is value:
+            return key
+    raise ValueError("no name for %r" % (value,))
+
+
+def from_controller(controller):
+    """
+    Describes a ``PendulumController`` as a spec.
+    """
+    from fuzzy.OutputVariable import OutputVariable
+    from control import DEFUZZIFIERS, NORMS, breakpoint_matrix
+
+    variables = sorted(controller.variables)
+    adjectives = []
+    owner = []
+    points = []
+    index = {}
+    for i, vname in enumerate(variables):
+        adjs = []
+        for aname, adjective in controller.variables[vname].adjectives.items():
+            p = adjective.set.points
+            adjs.append(([x for x, _ in p], [y for _, y in p], aname, adjective))
+        adjs.sort(key=lambda adj: (adj[0], adj[1]))
+        for xp, fp, aname, adjective in adjs:
+            index[id(adjective)] = len(adjectives)
+            adjectives.append(aname)
+            owner.append(i)
+            points.append((aname, xp, fp))
+    X, Y = breakpoint_matrix(points)
+    rules = [controller.rules[name] for name in sorted(controller.rules, key=int)]
+    # Built with an explicit shape, so that a controller without rules gives
+    # an empty matrix
+    antecedents = zeros((len(rules), len(rules[0].operator.inputs) if rules else 0), dtype=int)
+    for r, rule in enumerate(rules):
+        antecedents[r] = [index[id(i.adjective)] for i in rule.operator.inputs]
+    return {
+        'version': array(FORMAT_VERSION),
+        'variables': array(variables),
+        'outputs': array([isinstance(controller.variables[v], OutputVariable) for v in variables]),
+        'adjectives': array(adjectives),
+        'owner': array(owner, dtype=int),
+        'sizes': array([len(xp) for _, xp, _ in points], dtype=int),
+        'X': X,
+        'Y': Y,
+        'antecedents': antecedents,
+        'consequents': array([index[id(rule.adjective)] for rule in rules], dtype=int),
+        'norm': array(key_of(NORMS, controller.__AND__)),
+        'defuzzy': array(key_of(DEFUZZIFIERS, controller.defuzzy))
+    }
+
+
+def save(path, spec):
+    """
+    Writes a spec to ``path``.
+    """
+    savez(path, **spec)
+
+
+def load(path):
+    """
+    Reads a spec written by ``save``.
+    """
+    with load_arrays(path) as data:
+        spec = dict((name, data[name]) for name in data.files)
+    if int(spec['version']) != FORMAT_VERSION:
+        raise ValueError("unsupported controller format: %s" % spec['version'])
+    return spec
+
+
+def save_bank(path, specs):
+    """
+    Writes many variants of a controller to ``path``, compressed. They must
+    have the same variables and adjectives, and as many breakpoints and rules.
+    """
+    first = specs[0]
+    for spec in specs[1:]:
+        for name in SHARED:
+            if spec[name].shape != first[name].shape or (spec[name] != first[name]).any():
+                raise ValueError("variants differ in %s" % name)
+        for name in STACKED:
+            if spec[name].shape != first[name].shape:
+                raise ValueError("variants differ in the shape of %s" % name)
+    bank = dict((name, first[name]) for name in SHARED)
+    bank.update((name, stack([spec[name] for spec in specs])) for name in STACKED)
+    bank['version'] = array(FORMAT_VERSION)
+    savez_compressed(path, **bank)
+
+
+def load_bank(path):
+    """
+    Reads the variants written by ``save_bank``, as a list of specs. Their
+    arrays are views into the stacked arrays of the file.
+    """
+    bank = load(path)
+    return [dict([(name, bank[name]) for name in SHARED + ('version',)] +
+                 [(name, bank[name][i]) for name in STACKED])
+            for i in range(len(bank['norm']))]
+
+
+def adjectives_of(spec, i):
+    """
+    Returns the adjectives of the variable ``i`` of a spec, in the format
+    ``[(adjective, xp, fp)]``.
+    """
+    sizes = spec['sizes']
+    return [(str(spec['adjectives'][a]), spec['X'][a, :sizes[a]], spec['Y'][a, :sizes[a]])
+            for a in (spec['owner'] == i).nonzero()[0]]
+
+
+def to_engine(spec, resolution=1001):
+    """
+    Builds an ``ArrayController`` from a spec. The spec must have a single
+    output variable.
+    """
+    from control import ArrayController, DEFUZZIFIERS, NORMS
+
+    names = [str(v) for v in spec['variables']]
+    outputs = asarray(spec['outputs'], dtype=bool)
+    if outputs.sum() != 1:
+        raise ValueError("the engine needs a single output variable")
+    inputs = [(names[i], adjectives_of(spec, i)) for i in range(len(names)) if not outputs[i]]
+    output = outputs.nonzero()[0][0]
+    pairs = [(names[v], str(a)) for v, a in zip(spec['owner'], spec['adjectives'])]
+    rules = [(tuple(pairs[a] for a in ante), pairs[c][1])
+             for ante, c in zip(spec['antecedents'], spec['consequents'])]
+    return ArrayController(inputs, (names[output], adjectives_of(spec, output)), rules,
+                           NORMS[str(spec['norm'])], DEFUZZIFIERS[str(spec['defuzzy'])], resolution)
+
+
+def to_controller(spec):
+    """
+    Builds a ``PendulumController`` from a spec.
+    """
+    from fuzzy.InputVariable import InputVariable
+    from fuzzy.OutputVariable import OutputVariable
+    from fuzzy.fuzzify.Plain import Plain
+    from fuzzy.Adjective import Adjective
+    from control import DEFUZZIFIERS, NORMS, PendulumController
+    from mf import PiecewiseLinear
+
+    controller = PendulumController(DEFUZZIFIERS[str(spec['defuzzy'])], NORMS[str(spec['norm'])])
+    objects = [None] * len(spec['adjectives'])
+    for i, vname in enumerate(spec['variables']):
+        if spec['outputs'][i]:
+            variable = OutputVariable(defuzzify=controller.defuzzy())
+        else:
+            variable = InputVariable(fuzzify=Plain())
+        controller.variables[str(vname)] = variable
+        for a in (spec['owner'] == i).nonzero()[0]:
+            n = spec['sizes'][a]
+            objects[a] = Adjective(PiecewiseLinear(spec['X'][a, :n], spec['Y'][a, :n]))
+            variable.adjectives[str(spec['adjectives'][a])] = objects[a]
+    for ante, c in zip(spec['antecedents'], spec['consequents']):
+        controller.add_rule(tuple(objects[a] for a in ante), objects[c])
+    return controller
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writes the controller of ip.create_controller to a file.")
+    parser.add_argument('output', help="file where the controller is written")
+    args = parser.parse_args(argv)
+
+    from ip import create_controller
+    save(args.output, from_controller(create_controller()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Parameter sweep of the closed loop over a grid of norms, defuzzification
+methods, initial states and pendulum parameters. Every combination is
+simulated in a pool of processes and the stability metrics are collected in a
+single table.
+"""
+# Module level imports
+from __future__ import print_function
+import argparse
+import itertools
+import multiprocessing
+from timeit import default_timer as clock
+from numpy import array, pi
+
+# Project level imports
+from control import NORMS, DEFUZZIFIERS
+from headless import run
+from ip import InvertedPendulum, load_controller
+from metrics import stability
+
+SWEEP_DTYPE = [('norm', 'S10'), ('defuzzy', 'S14'),
+               ('O', float), ('w', float), ('x', float), ('v', float),
+               ('l', float), ('m', float), ('mc', float),
+               ('settling_time', float), ('max_angle', float), ('drift', float), ('effort', float)]
+
+# Controller of each worker process, loaded once by ``_init_worker``
+_controller = None
+
+
+def _init_worker():
+    global _controller
+    _controller = load_controller()
+
+
+def _simulate(args):
+    """
+    Simulates one point of the grid in a worker process.
+    """
+    norm, defuzzy, O, w, x, v, l, m, mc, steps, dt = args
+    _controller.set_norm(NORMS[norm])
+    _controller.set_defuzzy(DEFUZZIFIERS[defuzzy])
+    ip = InvertedPendulum(l, m, mc, dt)
+    ip.set_state(O, w, x, v)
+    track = run(ip, _controller, steps)
+    return (norm, defuzzy, O, w, x, v, l, m, mc) + stability(track, dt)
+
+
+def grid(norms, defuzzies, O, w, x, v, l, m, mc):
+    """
+    Builds every combination of the given values. Combinations sharing a norm
+    and a defuzzification method are kept together, so that workers seldom
+    need to switch them.
+
+    :Returns:
+      A list of tuples ``(norm, defuzzy, O, w, x, v, l, m, mc)``.
+    """
+    return list(itertools.product(norms, defuzzies, O, w, x, v, l, m, mc))
+
+
+def sweep(points, duration=10., dt=0.01, processes=None):
+    """
+    Simulates every point of a grid in parallel.
+
+    :Parameters:
+      points
+        List of tuples ``(norm, defuzzy, O, w, x, v, l, m, mc)``, where norm
+        and defuzzy are keys of ``NORMS`` and ``DEFUZZIFIERS``;
+      duration
+        Simulated time of each point, in seconds;
+      dt
+        Time step, in seconds;
+      processes
+        Number of worker processes. Defaults to the number of cores.
+
+    :Returns:
+      A structured array of ``SWEEP_DTYPE``, with a row for each point, in
+      the same order.
+    """
+    steps = int(round(duration / dt))
+    tasks = [p + (steps, dt) for p in points]
+    processes = processes or multiprocessing.cpu_count()
+    chunksize = max(1, len(tasks) // (4 * processes))
+    pool = multiprocessing.Pool(processes, _init_worker)
+    try:
+        rows = pool.map(_simulate, tasks, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+    return array(rows, dtype=SWEEP_DTYPE)
+
+
+def write_csv(table, path):
+    """
+    Writes a sweep table to a CSV file.
+    """
+    names = table.dtype.names
+    with open(path, 'w') as f:
+        f.write(','.join(names) + '\n')
+        for row in table:
+            f.write(','.join(r.decode() if isinstance(r, bytes) else repr(float(r)) for r in row) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweeps the closed loop over a grid of parameters.")
+    parser.add_argument('--norm', nargs='+', choices=sorted(NORMS), default=sorted(NORMS))
+    parser.add_argument('--defuzzy', nargs='+', choices=sorted(DEFUZZIFIERS), default=sorted(DEFUZZIFIERS))
+    parser.add_argument('--theta', nargs='+', type=float, default=[22.5], help="initial angles, in degrees")
+    parser.add_argument('--omega', nargs='+', type=float, default=[0.], help="initial angular velocities")
+    parser.add_argument('--x', nargs='+', type=float, default=[0.], help="initial cart positions")
+    parser.add_argument('--v', nargs='+', type=float, default=[0.], help="initial cart speeds")
+    parser.add_argument('--l', nargs='+', type=float, default=[0.5], help="pendulum lengths")
+    parser.add_argument('--m', nargs='+', type=float, default=[0.1], help="pendulum masses")
+    parser.add_argument('--mc', nargs='+', type=float, default=[0.5], help="cart masses")
+    parser.add_argument('--duration', type=float, default=10.)
+    parser.add_argument('--dt', type=float, default=0.01)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', default='sweep.csv')
+    args = parser.parse_args(argv)
+
+    points = grid(args.norm, args.defuzzy, [O * pi / 180. for O in args.theta], args.omega,
+                  args.x, args.v, args.l, args.m, args.mc)
+    t0 = clock()
+    table = sweep(points, args.duration, args.dt, args.processes)
+    elapsed = clock() - t0
+    write_csv(table, args.output)
+    print("%d runs in %.3f s (%.2f runs/s)" % (len(table), elapsed, len(table) / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Equivalence of the array engine and the exact inference of pyfuzzy.
+"""
+# Module level imports
+import unittest
+from numpy import linspace, meshgrid, pi
+
+try:
+    import fuzzy  # noqa: F401
+except ImportError:
+    raise unittest.SkipTest("pyfuzzy is not installed")
+
+# Project level imports
+from fuzzy.norm.Max import Max
+from control import ArrayController, ControlSurface, DEFUZZIFIERS, EXACT_METHODS, NORMS
+from ip import add_cart_table, create_controller
+
+# Largest difference tolerated against pyfuzzy, in newtons
+TOLERANCE = 1e-6
+
+
+def grid():
+    """
+    Grid of inputs covering the membership functions of O and w and beyond.
+    """
+    O, w = meshgrid(linspace(-pi / 2, pi / 2, 25), linspace(-4 * pi, 4 * pi, 21))
+    return {'O': O.ravel(), 'w': w.ravel()}
+
+
+def cart_grid():
+    """
+    Grid of inputs covering the membership functions of O, w, x and v.
+    """
+    O, w, x, v = meshgrid(linspace(-pi / 2, pi / 2, 9), linspace(-4 * pi, 4 * pi, 7),
+                          linspace(-12., 12., 7), linspace(-8., 8., 7))
+    return {'O': O.ravel(), 'w': w.ravel(), 'x': x.ravel(), 'v': v.ravel()}
+
+
+def cart_controller():
+    """
+    Controller of ``create_controller`` with the table of rules of the cart.
+    """
+    controller = create_controller()
+    add_cart_table(controller)
+    return controller
+
+
+class ArrayControllerTest(unittest.TestCase):
+
+    def test_max_error(self):
+        controller = create_controller()
+        input = grid()
+        for norm in sorted(NORMS):
+            for defuzzy in sorted(name for name in DEFUZZIFIERS if DEFUZZIFIERS[name] in EXACT_METHODS):
+                controller.set_norm(NORMS[norm])
+                controller.set_defuzzy(DEFUZZIFIERS[defuzzy])
+                engine = ArrayController.from_controller(controller)
+                error = engine.max_error(controller, input)
+                self.assertLess(error, TOLERANCE, "%s, %s: %g" % (norm, defuzzy, error))
+
+    def test_pruned(self):
+        for controller, input in ((create_controller(), grid()), (cart_controller(), cart_grid())):
+            controller.set_defuzzy(DEFUZZIFIERS['exact-cog'])
+            pruned = ArrayController.from_controller(controller)
+            self.assertTrue(pruned.pruned)
+            dense = ArrayController.from_controller(controller)
+            dense.pruned = False
+            for norm in sorted(NORMS):
+                pruned.set_norm(NORMS[norm])
+                dense.set_norm(NORMS[norm])
+                # A single chunk, large enough to be pruned
+                self.assertEqual(abs(pruned(input, chunk=len(input['O'])) - dense(input)).max(), 0.)
+
+    def test_cart_max_error(self):
+        controller = cart_controller()
+        controller.set_defuzzy(DEFUZZIFIERS['exact-cog'])
+        input = cart_grid()
+        input = dict((name, x[::7]) for name, x in input.items())
+        for norm in sorted(NORMS):
+            controller.set_norm(NORMS[norm])
+            error = ArrayController.from_controller(controller).max_error(controller, input)
+            self.assertLess(error, TOLERANCE, "%s: %g" % (norm, error))
+
+
+class PendulumControllerTest(unittest.TestCase):
+
+    def test_engine(self):
+        controller = create_controller()
+        input = {'O': 0.45, 'w': 0.5}
+        exact = controller.calculate(input, {'F': 0.})['F']
+        self.assertEqual(controller(input, {'F': 0.}), exact)
+
+        # pyfuzzy's own defuzzification methods go through pyfuzzy
+        controller.set_engine(True)
+        self.assertEqual(controller(input, {'F': 0.}), exact)
+
+        controller.set_defuzzy(DEFUZZIFIERS['exact-cog'])
+        exact = controller.calculate(input, {'F': 0.})['F']
+        self.assertAlmostEqual(controller(input, {'F': 0.}), exact)
+
+        # Norms the engine does not support go through pyfuzzy
+        controller.set_norm(Max)
+        self.assertEqual(controller(input, {'F': 0.}), controller.calculate(input, {'F': 0.})['F'])
+
+    def test_unused_inputs(self):
+        controller = create_controller()
+        input = {'O': 0.45, 'w': 0.5}
+        self.assertEqual(controller.used_inputs(), frozenset(['O', 'w']))
+        self.assertEqual(controller(dict(input, x=1., v=-2.), {'F': 0.}), controller(input, {'F': 0.}))
+        controller = cart_controller()
+        self.assertEqual(controller.used_inputs(), frozenset(['O', 'w', 'x', 'v']))
+
+    def test_edited_breakpoints(self):
+        controller = create_controller()
+        controller.set_defuzzy(DEFUZZIFIERS['exact-cog'])
+        controller.set_engine(True)
+        input = {'O': 0.45, 'w': 0.5}
+        before = controller(input, {'F': 0.})
+        mf = controller.variables['O'].adjectives['Osp'].set
+        x = mf.xp[-1]
+        mf.remove(x)
+        mf.add(x=x + 0.3, y=0.)
+        after = controller(input, {'F': 0.})
+        self.assertNotAlmostEqual(after, before)
+        self.assertAlmostEqual(after, controller.calculate(input, {'F': 0.})['F'])
+
+    def test_edited_output_set(self):
+        # The closed-form defuzzification keeps the breakpoints of the output
+        # set between calls, and must see the edit
+        controller = create_controller()
+        controller.set_defuzzy(DEFUZZIFIERS['exact-cog'])
+        input = {'O': 0.45, 'w': 0.5}
+        before = controller(input, {'F': 0.})
+        mf = controller.variables['F'].adjectives['Fbp'].set
+        x = mf.xp[-1]
+        mf.remove(x)
+        mf.add(x=x + 40., y=0.)
+        after = controller(input, {'F': 0.})
+        self.assertNotAlmostEqual(after, before)
+        self.assertAlmostEqual(after, float(ArrayController.from_controller(controller)(input)[0]))
+
+
+class ControlSurfaceTest(unittest.TestCase):
+
+    def test_resolution(self):
+        controller = create_controller()
+        self.assertRaises(ValueError, ControlSurface, controller, resolution=(1, 61))
+        self.assertRaises(ValueError, ControlSurface, controller, resolution=(61, 0))
+        surface = ControlSurface(controller, resolution=(2, 2))
+        O, w = surface.x1[0], surface.x2[-1]
+        self.assertAlmostEqual(surface(O, w), controller.calculate({'O': O, 'w': w}, {'F': 0.})['F'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+"""
+Tests of the numerical integrators on the pendulum.
+"""
+# Module level imports
+import unittest
+from numpy import abs, array, nan, pi, zeros
+
+# Project level imports
+from integrators import rk45
+from ip import InvertedPendulum
+
+
+def trajectory(steps=100, F=2., **options):
+    """
+    Open loop trajectory of the pendulum from 22.5 degrees, with a constant
+    force, as an array of states ``(O, w, x, v)``.
+    """
+    ip = InvertedPendulum(**options)
+    ip.set_state(pi / 8, 0., 0., 0.)
+    return array([ip.apply(F) for _ in range(steps)])
+
+
+class RK45Test(unittest.TestCase):
+
+    def test_against_rk4(self):
+        reference = trajectory(integrator='rk4', substeps=100)
+        self.assertLess(abs(trajectory(integrator='rk45') - reference).max(), 1e-6)
+
+    def test_non_finite(self):
+        f = lambda y: array([nan, 0., 0., 0.])
+        self.assertRaises(ArithmeticError, rk45, f, zeros(4), 0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
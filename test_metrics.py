@@ -0,0 +1,36 @@
+"""
+Tests of the stability metrics.
+"""
+# Module level imports
+import unittest
+from numpy import array, inf, zeros
+
+# Project level imports
+from ip import TRACK_DTYPE
+from metrics import settling_time, stability
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_settling_time(self):
+        self.assertEqual(settling_time(array([0.5, 0.1, 0., 0.]), 0.01), 0.02)
+        self.assertEqual(settling_time(array([0., 0.]), 0.01), 0.)
+        self.assertEqual(settling_time(array([0., 0.5]), 0.01), inf)
+
+    def test_stability(self):
+        track = zeros(4, dtype=TRACK_DTYPE)
+        track['O'] = [0.5, -0.6, 0., 0.]
+        track['x'] = [1., 1.5, 0.2, 1.]
+        track['F'] = [10., -10., 0., 0.]
+        settling, angle, drift, effort = stability(track, 0.01)
+        self.assertEqual(settling, 0.02)
+        self.assertEqual(angle, 0.6)
+        self.assertAlmostEqual(drift, 0.8)
+        self.assertAlmostEqual(effort, 2.)
+
+    def test_empty(self):
+        self.assertRaises(ValueError, stability, zeros(0, dtype=TRACK_DTYPE), 0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
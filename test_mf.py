@@ -0,0 +1,62 @@
+"""
+Tests of the piecewise linear membership functions.
+"""
+# Module level imports
+import unittest
+from numpy import array, linspace
+
+try:
+    import fuzzy  # noqa: F401
+except ImportError:
+    raise unittest.SkipTest("pyfuzzy is not installed")
+
+# Project level imports
+from mf import PiecewiseLinear, flat_saw, flat_saw_matrix, memberships
+
+
+class PiecewiseLinearTest(unittest.TestCase):
+
+    def test_remove(self):
+        f = PiecewiseLinear([0., 1., 2.], [0., 1., 0.])
+        f.remove(1.)
+        self.assertEqual(f.xp.tolist(), [0., 2.])
+        self.assertEqual(f.fp.tolist(), [0., 0.])
+        self.assertEqual(f(1.), 0.)
+
+    def test_add_after_clear(self):
+        f = PiecewiseLinear([0., 1., 2.], [0., 1., 0.])
+        f.clear()
+        self.assertEqual(len(f.xp), 0)
+        f.add(x=0., y=1.)
+        f.add(x=4., y=0.)
+        self.assertEqual(f.xp.tolist(), [0., 4.])
+        self.assertEqual(f(1.), 0.75)
+
+    def test_revision(self):
+        before = PiecewiseLinear.revision
+        f = PiecewiseLinear([0., 1., 2.], [0., 1., 0.])
+        self.assertEqual(PiecewiseLinear.revision, before)
+        f.remove(2.)
+        self.assertGreater(PiecewiseLinear.revision, before)
+
+
+class FlatSawTest(unittest.TestCase):
+
+    def test_functions(self):
+        functions = flat_saw((-1., 1.), 3)
+        self.assertEqual(len(functions), 3)
+        X, Y = flat_saw_matrix((-1., 1.), 3)
+        u = linspace(-2., 2., 41)
+        expected = memberships(X, Y, u)
+        for k, f in enumerate(functions):
+            self.assertEqual(f(u).tolist(), expected[:, k].tolist())
+        # The ramps keep their end values outside of the interval
+        self.assertEqual(memberships(X, Y, array([-5., 5.])).tolist(), [[1., 0., 0.], [0., 0., 1.]])
+
+    def test_too_few(self):
+        self.assertRaises(ValueError, flat_saw, (-1., 1.), 1)
+        self.assertRaises(ValueError, flat_saw_matrix, (-1., 1.), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
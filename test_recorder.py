@@ -0,0 +1,97 @@
+"""
+Tests of the recording of trajectories to chunk files and their playback.
+"""
+# Module level imports
+import os
+import shutil
+import tempfile
+import unittest
+from numpy import arange, concatenate, empty
+
+# Project level imports
+from ip import TIMED_DTYPE
+from recorder import Recorder, Recording
+
+# Stand-ins for the norms and defuzzification methods, which are only
+# recorded by name
+NORMS = {'min': 'Min', 'algebraic': 'AlgebraicProduct'}
+DEFUZZIFIERS = {'cog': 'COG', 'exact-cog': 'ExactCOG'}
+
+
+def track(t):
+    """
+    Records at the times ``t``, with the other fields derived from them.
+    """
+    records = empty(len(t), dtype=TIMED_DTYPE)
+    records['t'] = t
+    for k, name in enumerate(('O', 'w', 'x', 'v', 'F')):
+        records[name] = (k + 1) * t
+    return records
+
+
+class RecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'recording')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def record(self, parts):
+        """
+        Records a list of ``(track, norm, defuzzy)`` in chunks of 10 records
+        with a buffer of 4.
+        """
+        with Recorder(self.path, chunk=10, buffer=4, norms=NORMS, defuzzifiers=DEFUZZIFIERS) as recorder:
+            for records, norm, defuzzy in parts:
+                recorder.extend(records, norm, defuzzy)
+        return Recording(self.path)
+
+    def test_round_trip(self):
+        # Extensions smaller and larger than the buffer, across chunk bounds
+        first = track((arange(3) + 1) * 0.01)
+        second = track((arange(3, 25) + 1) * 0.01)
+        recording = self.record([(first, 'Min', 'COG'), (second, 'AlgebraicProduct', 'ExactCOG')])
+        self.assertEqual(len(recording), 25)
+        self.assertEqual(len(recording.chunks), 3)
+        records = recording[0:25]
+        expected = concatenate((first, second))
+        for name in TIMED_DTYPE.names:
+            self.assertEqual(records[name].tolist(), expected[name].tolist())
+        self.assertEqual(records['norm'].tolist(),
+                         [recording.norms.index('min')] * 3 + [recording.norms.index('algebraic')] * 22)
+        self.assertEqual(recording.norms[records['norm'][0]], 'min')
+        self.assertEqual(recording.defuzzifiers[records['defuzzy'][-1]], 'exact-cog')
+        self.assertEqual(recording[-1]['t'], records['t'][-1])
+        self.assertEqual(recording[12:17]['O'].tolist(), expected['O'][12:17].tolist())
+
+    def test_index_after_reset(self):
+        # 15 steps of 0.01s, then the time goes back to 0 with steps of 0.02s
+        before = track((arange(15) + 1) * 0.01)
+        after = track(arange(8) * 0.02)
+        recording = self.record([(before, 'Min', 'COG'), (after, 'Min', 'COG')])
+        segments = recording.index()
+        self.assertEqual(segments['start'].tolist(), [0, 15])
+        self.assertEqual(segments['count'].tolist(), [15, 8])
+        self.assertAlmostEqual(segments['dt'][0], 0.01)
+        self.assertAlmostEqual(segments['dt'][1], 0.02)
+        self.assertAlmostEqual(segments['T'][1], 0.15)
+        self.assertAlmostEqual(recording.duration(), 0.15 + 8 * 0.02)
+
+        self.assertEqual(recording.seek(0.), 0)
+        self.assertEqual(recording.seek(0.055), 5)
+        self.assertEqual(recording.seek(0.15 + 0.045), 17)
+        self.assertEqual(recording.seek(10.), 22)
+        self.assertAlmostEqual(recording.timeline(17), 0.15 + 0.04)
+
+        # The index is saved and found again by the next reader
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'index.npy')))
+        self.assertEqual(Recording(self.path).index().tolist(), segments.tolist())
+
+    def test_existing_recording(self):
+        self.record([(track(arange(2) * 0.01), 'Min', 'COG')])
+        self.assertRaises(ValueError, Recorder, self.path, norms=NORMS, defuzzifiers=DEFUZZIFIERS)
+
+
+if __name__ == "__main__":
+    unittest.main()
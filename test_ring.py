@@ -0,0 +1,50 @@
+"""
+Tests of the ring buffer of the simulation worker.
+"""
+# Module level imports
+import unittest
+from numpy import arange, array, float64
+
+# Project level imports
+from ring import RingBuffer
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def test_append(self):
+        ring = RingBuffer(4, float64)
+        for x in range(6):
+            ring.append(x)
+        self.assertEqual(len(ring), 4)
+        self.assertEqual(ring.total, 6)
+        self.assertEqual(ring.view().tolist(), [2., 3., 4., 5.])
+        self.assertEqual(ring.last(), 5.)
+
+    def test_extend_wraparound(self):
+        ring = RingBuffer(4, float64)
+        ring.extend(arange(3.))
+        ring.extend(arange(3., 6.))
+        self.assertEqual(ring.view().tolist(), [2., 3., 4., 5.])
+        self.assertEqual(ring.total, 6)
+        ring.append(6.)
+        self.assertEqual(ring.view().tolist(), [3., 4., 5., 6.])
+
+    def test_extend_longer_than_size(self):
+        ring = RingBuffer(4, float64)
+        ring.append(-1.)
+        ring.extend(arange(10.))
+        self.assertEqual(len(ring), 4)
+        self.assertEqual(ring.total, 11)
+        self.assertEqual(ring.view().tolist(), [6., 7., 8., 9.])
+
+    def test_clear(self):
+        ring = RingBuffer(3, float64)
+        ring.extend(array([1., 2.]))
+        ring.clear()
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(ring.total, 0)
+        self.assertRaises(IndexError, ring.last)
+
+
+if __name__ == "__main__":
+    unittest.main()
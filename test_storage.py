@@ -0,0 +1,53 @@
+"""
+Tests of the compact on-disk format of controllers.
+"""
+# Module level imports
+import os
+import shutil
+import tempfile
+import unittest
+from numpy import array, linspace, meshgrid, pi
+
+try:
+    import fuzzy  # noqa: F401
+except ImportError:
+    raise unittest.SkipTest("pyfuzzy is not installed")
+
+# Project level imports
+import storage
+from control import PendulumController
+from ip import create_controller
+
+
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        controller = create_controller()
+        path = os.path.join(self.directory, 'controller.npz')
+        storage.save(path, storage.from_controller(controller))
+        spec = storage.load(path)
+        loaded = storage.to_controller(spec)
+        engine = storage.to_engine(dict(spec, defuzzy=array('exact-cog')))
+        O, w = meshgrid(linspace(-pi / 2, pi / 2, 7), linspace(-4 * pi, 4 * pi, 5))
+        for a, b in zip(O.ravel(), w.ravel()):
+            input = {'O': a, 'w': b}
+            self.assertEqual(loaded.calculate(input, {'F': 0.})['F'], controller.calculate(input, {'F': 0.})['F'])
+        self.assertEqual(len(engine.consequents), len(controller.rules))
+
+    def test_no_rules(self):
+        controller = create_controller()
+        empty = PendulumController()
+        empty.variables = controller.variables
+        spec = storage.from_controller(empty)
+        self.assertEqual(spec['antecedents'].shape, (0, 0))
+        self.assertEqual(len(storage.to_controller(spec).rules), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
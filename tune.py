@@ -0,0 +1,339 @@
+"""
+Automatic tuning of a controller. The search varies the scale of the
+interval of every variable used by the rules, and the consequent of every
+rule, starting from a base controller, by default the one of
+``ip.create_controller``.
+
+Each candidate is scored by its closed loop cost over a fixed batch of
+initial states. Candidates are not built as controllers: scaling the
+interval of an input is the same as dividing the input by the scale, and
+scaling the output interval multiplies the output, so the base engine is
+evaluated once for a whole group of candidates, each row with its own scales
+and rule consequents. Groups are simulated in parallel, and the search state
+is checkpointed after every generation, so that an interrupted search can be
+resumed. The best controller is written with ``storage.save``.
+"""
+# Module level imports
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+from timeit import default_timer as clock
+from numpy import abs, arange, argsort, array, asarray, clip, exp, flatnonzero, maximum, ones, pi, repeat, \
+    tile, unique, zeros
+from numpy.random import RandomState
+
+# Project level imports
+import storage
+from control import DEFUZZIFIERS, EXACT_METHODS, NORMS
+from ip import BatchPendulum
+from metrics import FALL_ANGLE
+
+CHECKPOINT_VERSION = 1
+
+
+class Objective(object):
+    """
+    Closed loop cost of candidate variants of a controller. A candidate is a
+    pair ``(scales, levels)``: the scale of the interval of each of
+    ``tuned`` and, for each rule, the index of its consequent among the
+    adjectives of the output, in increasing order.
+    """
+
+    def __init__(self, spec, O, w, duration=3., dt=0.01, effort=1e-4, l=0.5, m=0.1, mc=0.5):
+        """
+        Creates the objective.
+
+        :Parameters:
+          spec
+            The base controller, as a spec of ``storage``. It must have a
+            single output variable;
+          O, w
+            Arrays of initial angles and angular velocities of the batch;
+          duration
+            Simulated time of each initial state, in seconds;
+          dt, l, m, mc
+            Parameters of the pendulum, as in ``ip.BatchPendulum``;
+          effort
+            Weight of the squared force in the cost.
+        """
+        self.spec = spec
+        self.engine = storage.to_engine(spec)
+        self.O = asarray(O, dtype=float)
+        self.w = asarray(w, dtype=float)
+        self.steps = int(round(duration / dt))
+        self.dt = dt
+        self.effort = effort
+        self.pendulum = (l, m, mc)
+
+        # The tuned variables are the inputs used by the rules, then the output
+        names = [str(v) for v in spec['variables']]
+        used = unique(spec['owner'][spec['antecedents'].ravel()])
+        output = flatnonzero(spec['outputs'])[0]
+        self.tuned = [names[i] for i in used] + [names[output]]
+        self.outputs = flatnonzero(spec['owner'] == output)
+        level = dict((a, k) for k, a in enumerate(self.outputs))
+        self.base_levels = array([level[c] for c in spec['consequents']], dtype=int)
+
+    def controller(self, scales, levels):
+        """
+        Returns a batched controller, as used by ``ip.BatchPendulum.step``,
+        where each row has its own candidate.
+
+        :Parameters:
+          scales, levels
+            ``(N, V)`` and ``(N, R)`` arrays with the candidate of each row.
+        """
+        engine = self.engine
+        inputs = self.tuned[:-1]
+        rows = arange(len(scales))
+        K = len(self.outputs)
+
+        def call(input):
+            input = dict((name, input[name] / scales[:, i]) for i, name in enumerate(inputs))
+            s = engine.fire(engine.memberships(input))
+            alpha = zeros((len(rows), K))
+            for r in range(s.shape[1]):
+                k = levels[:, r]
+                alpha[rows, k] = maximum(alpha[rows, k], s[:, r])
+            return engine.exact(alpha) * scales[:, -1]
+        return call
+
+    def __call__(self, scales, levels):
+        """
+        Computes the cost of a group of candidates.
+
+        :Parameters:
+          scales, levels
+            ``(C, V)`` and ``(C, R)`` arrays with one candidate per line.
+
+        :Returns:
+          An array with the cost of each candidate: the mean over the batch of
+          the integral of the squared angle plus ``effort`` times the squared
+          force. Once fallen, a pendulum costs ``metrics.FALL_ANGLE`` squared
+          up to the end.
+        """
+        scales = asarray(scales, dtype=float)
+        levels = asarray(levels, dtype=int)
+        n = len(self.O)
+        rows = len(scales) * n
+        ip = BatchPendulum(rows, *self.pendulum, dt=self.dt)
+        ip.set_state(tile(self.O, len(scales)), tile(self.w, len(scales)))
+        controller = self.controller(repeat(scales, n, axis=0), repeat(levels, n, axis=0))
+        cost = zeros(rows)
+        alive = ones(rows, dtype=bool)
+        for _ in range(self.steps):
+            O, w, x, v = ip.get_state()
+            alive &= abs(O) <= FALL_ANGLE
+            F = controller({'O': O, 'w': w, 'x': x, 'v': v})
+            cost += self.dt * (alive * (O * O + self.effort * F * F) + ~alive * FALL_ANGLE ** 2)
+            ip.apply(F)
+        return cost.reshape(-1, n).mean(axis=1)
+
+    def to_spec(self, scales, levels):
+        """
+        Returns the spec of the controller of a candidate.
+        """
+        spec = dict(self.spec)
+        names = [str(v) for v in spec['variables']]
+        X = spec['X'].copy()
+        for name, scale in zip(self.tuned, scales):
+            X[spec['owner'] == names.index(name)] *= scale
+        spec['X'] = X
+        spec['consequents'] = self.outputs[asarray(levels, dtype=int)]
+        return spec
+
+
+def initial_states(n, theta=3 * pi / 16, omega=2., seed=0):
+    """
+    Returns ``n`` initial angles and angular velocities, drawn uniformly from
+    ``[-theta, theta]`` and ``[-omega, omega]``, the same for a given seed.
+    """
+    random = RandomState(seed)
+    return random.uniform(-theta, theta, n), random.uniform(-omega, omega, n)
+
+
+def spec_hash(spec):
+    """
+    Hash of the arrays of a spec.
+    """
+    digest = hashlib.sha1()
+    for name in sorted(spec):
+        digest.update(name.encode('utf-8'))
+        digest.update(asarray(spec[name]).tobytes())
+    return digest.hexdigest()
+
+
+def mutate(random, scales, levels, K, sigma=0.1, rate=None, bounds=(0.25, 4.)):
+    """
+    Returns a random variant of a candidate: every scale is multiplied by a
+    log-normal factor, and each rule moves its consequent one adjective up or
+    down with probability ``rate``, by default one rule on average.
+    """
+    scales = clip(scales * exp(random.normal(0., sigma, len(scales))), *bounds)
+    rate = 1. / len(levels) if rate is None else rate
+    step = (random.uniform(size=len(levels)) < rate) * random.choice((-1, 1), len(levels))
+    return scales, clip(levels + step, 0, K - 1)
+
+
+# Objective of each worker process, created once by ``_init_worker``
+_objective = None
+
+
+def _init_worker(spec, settings):
+    global _objective
+    _objective = Objective(spec, **settings)
+
+
+def _evaluate(args):
+    """
+    Computes the cost of a group of candidates in a worker process.
+    """
+    scales, levels = args
+    return _objective(scales, levels)
+
+
+def tune(spec, settings, generations=20, children=256, survivors=16, group=16, processes=None,
+         checkpoint=None, seed=0, log=print):
+    """
+    Searches for the candidate of lowest cost with a (mu + lambda)
+    evolution strategy: every generation, ``children`` mutants of the
+    ``survivors`` best candidates so far are scored, and the best of both
+    survive.
+
+    :Parameters:
+      spec
+        The base controller, as a spec of ``storage``;
+      settings
+        Keyword arguments of ``Objective``, besides the spec;
+      generations
+        Number of generations, including the ones of a resumed search;
+      children, survivors
+        Number of candidates scored per generation, and kept;
+      group
+        Number of candidates simulated together by a worker;
+      processes
+        Number of worker processes. Defaults to the number of cores;
+      checkpoint
+        File where the search state is written after every generation, and
+        resumed from if it exists, or None;
+      seed
+        Seed of the mutations. A resumed search gives the same result as an
+        uninterrupted one;
+      log
+        Function called with a progress line per generation, or None.
+
+    :Returns:
+      A tuple ``(objective, population)``, where ``population`` is a list of
+      ``(cost, scales, levels)`` sorted by cost.
+    """
+    objective = Objective(spec, **settings)
+    K = len(objective.outputs)
+    key = hashlib.sha1((spec_hash(spec) + json.dumps(settings, sort_keys=True) +
+                        repr((children, survivors, seed))).encode('utf-8')).hexdigest()
+    start = 0
+    population = None
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state = json.load(f)
+        if state['version'] != CHECKPOINT_VERSION or state['key'] != key:
+            raise ValueError("%s is a checkpoint of another search" % checkpoint)
+        start = state['generation']
+        population = [(c, array(s), array(l, dtype=int)) for c, s, l in state['population']]
+
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes, _init_worker, (spec, settings))
+    try:
+        if population is None:
+            scales = ones(len(objective.tuned))
+            levels = objective.base_levels
+            population = [(float(objective(scales[None], levels[None])[0]), scales, levels)]
+        for generation in range(start, generations):
+            t0 = clock()
+            random = RandomState([seed, generation])
+            candidates = []
+            for _ in range(children):
+                _, scales, levels = population[random.randint(len(population))]
+                candidates.append(mutate(random, scales, levels, K))
+            groups = [(array([s for s, _ in candidates[i:i + group]]), array([l for _, l in candidates[i:i + group]]))
+                      for i in range(0, len(candidates), group)]
+            costs = [c for part in pool.map(_evaluate, groups) for c in part]
+            merged = population + [(float(c), s, l) for c, (s, l) in zip(costs, candidates)]
+            order = argsort([c for c, _, _ in merged], kind='mergesort')
+            population = [merged[i] for i in order[:survivors]]
+            if checkpoint is not None:
+                save_checkpoint(checkpoint, key, generation + 1, population)
+            if log is not None:
+                log("generation %d: best %.6f, %d candidates in %.3f s" %
+                    (generation + 1, population[0][0], len(candidates), clock() - t0))
+    finally:
+        pool.close()
+        pool.join()
+    return objective, population
+
+
+def save_checkpoint(path, key, generation, population):
+    """
+    Writes the search state to ``path``, replacing the former one at once.
+    """
+    state = {'version': CHECKPOINT_VERSION, 'key': key, 'generation': generation,
+             'population': [(c, s.tolist(), l.tolist()) for c, s, l in population]}
+    temp = '%s.%d' % (path, os.getpid())
+    with open(temp, 'w') as f:
+        json.dump(state, f)
+    os.rename(temp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tunes the intervals and the rule table of a controller.")
+    parser.add_argument('--base', default=None, help="controller file to start from, as written by storage.py")
+    parser.add_argument('--norm', choices=sorted(NORMS), default=None)
+    # The candidates are scored in batches, so only the methods of the array
+    # engine can be tuned
+    parser.add_argument('--defuzzy', choices=sorted(n for n, d in DEFUZZIFIERS.items() if d in EXACT_METHODS),
+                        default=None, help="defaults to the one of the base controller, or exact-cog")
+    parser.add_argument('--states', type=int, default=64, help="initial states scored")
+    parser.add_argument('--theta', type=float, default=33.75, help="largest initial angle, in degrees")
+    parser.add_argument('--omega', type=float, default=2., help="largest initial angular velocity")
+    parser.add_argument('--duration', type=float, default=3.)
+    parser.add_argument('--dt', type=float, default=0.01)
+    parser.add_argument('--effort', type=float, default=1e-4, help="weight of the squared force")
+    parser.add_argument('--generations', type=int, default=20)
+    parser.add_argument('--children', type=int, default=256, help="candidates per generation")
+    parser.add_argument('--survivors', type=int, default=16)
+    parser.add_argument('--group', type=int, default=16, help="candidates simulated together")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--checkpoint', default='tune.json', help="search state, resumed if it exists")
+    parser.add_argument('--output', default='tuned.npz', help="file where the best controller is written")
+    args = parser.parse_args(argv)
+
+    if args.base is not None:
+        spec = storage.load(args.base)
+    else:
+        from ip import load_controller
+        spec = storage.from_controller(load_controller())
+    if args.norm is not None:
+        spec['norm'] = array(args.norm)
+    if args.defuzzy is not None:
+        spec['defuzzy'] = array(args.defuzzy)
+    if DEFUZZIFIERS[str(spec['defuzzy'])] not in EXACT_METHODS:
+        print("%s is not supported by the array engine, tuning with exact-cog" % spec['defuzzy'])
+        spec['defuzzy'] = array('exact-cog')
+    O, w = initial_states(args.states, args.theta * pi / 180., args.omega, args.seed)
+    settings = {'O': O.tolist(), 'w': w.tolist(), 'duration': args.duration, 'dt': args.dt,
+                'effort': args.effort}
+
+    t0 = clock()
+    objective, population = tune(spec, settings, args.generations, args.children, args.survivors,
+                                 args.group, args.processes, args.checkpoint, args.seed)
+    cost, scales, levels = population[0]
+    storage.save(args.output, objective.to_spec(scales, levels))
+    print("best cost %.6f in %.3f s, scales %s" %
+          (cost, clock() - t0, ', '.join('%s %.3f' % (n, s) for n, s in zip(objective.tuned, scales))))
+
+
+if __name__ == "__main__":
+    main()
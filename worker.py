@@ -0,0 +1,251 @@
+"""
+Background simulation of the closed loop. The worker thread owns the
+pendulum, the controller and the trajectory; the interface talks to it only
+through messages and reads what it publishes.
+"""
+# Module level imports
+import threading
+import time
+from timeit import default_timer as clock
+from numpy import dtype, empty, float64, zeros
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+# Project level imports
+from ip import TIMED_DTYPE
+from profiler import Profiler
+from recorder import Recorder
+from ring import RingBuffer
+from scheduler import MultiRate
+from storage import from_controller, to_controller
+
+# Record published to the interface: the latest record of the trajectory,
+# and the state measured by the controller when it computed the force of it
+SNAPSHOT_DTYPE = dtype(TIMED_DTYPE.descr + [('Om', float64), ('wm', float64), ('xm', float64), ('vm', float64)])
+
+
+class SimulationWorker(threading.Thread):
+    """
+    Thread that runs the closed loop. The latest state is published through a
+    double buffer: it is written to the back slot, and then the slots are
+    swapped with a single assignment, so readers never wait for the worker.
+    The trajectory is kept in a ring buffer, extended once per frame under
+    ``lock``.
+
+    Messages are tuples sent with ``send``:
+
+      ``('start',)``, ``('stop',)``, ``('step',)``, ``('quit',)``
+        Control the simulation;
+      ``('reset', O, w, x, v, F)``
+        Sets the state of the pendulum and clears the trajectory;
+      ``('speed', speed, steps_per_frame)``
+        Multiple of real time, or None to run as fast as possible, and number
+        of steps between publications in the latter case;
+      ``('norm', norm)``, ``('defuzzy', defuzzy)``, ``('engine', enabled)``,
+      ``('table', enabled)``
+        Configure the controller;
+      ``('ratio', ratio)``, ``('delay', delay)``
+        Configure the scheduler;
+      ``('profile', enabled)``
+        Starts or stops timing the steps into ``profiler``;
+      ``('record', path)``
+        Starts streaming the trajectory to a ``recorder.Recorder`` in the
+        directory ``path``, or stops if it is None.
+    """
+
+    def __init__(self, ip, pc, window=2.5):
+        """
+        Creates the worker. It must be started with ``start``.
+
+        :Parameters:
+          ip
+            The inverted pendulum;
+          pc
+            The controller;
+          window
+            Seconds of trajectory kept in the ring buffer.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.ip = ip
+        self.pc = pc
+        self.scheduler = MultiRate(ip, pc)
+        self.track = RingBuffer(int(round(window / ip.dt)), TIMED_DTYPE)
+        self.lock = threading.Lock()
+        self.messages = Queue()
+        self.running = False
+        self.speed = 1.
+        self.steps_per_frame = 10
+        self.frame_time = 1. / 30.  # Seconds between publications in real time
+        self.max_lag = 0.25  # Seconds the simulation may fall behind the clock
+        self.t = 0.
+        self.resets = 0  # Incremented whenever the trajectory is cleared
+        self.error = None  # Error bound of the control surface in use
+        self.version = 0  # Incremented on every publication
+        # Timings of the steps, and of the rendering by the interface thread
+        self.profiler = Profiler(('controller', 'physics', 'view', 'plot', 'replot'))
+        self.recorder = None  # Where the trajectory is streamed, if anywhere
+        self.__states = zeros(2, dtype=SNAPSHOT_DTYPE)
+        self.__front = 0
+        self.__alive = True
+
+    def send(self, *message):
+        """
+        Sends a message to the worker.
+        """
+        self.messages.put(message)
+
+    def snapshot(self):
+        """
+        Returns the latest published record, of ``SNAPSHOT_DTYPE``. It is a
+        view over the double buffer, valid until the next two publications.
+        """
+        return self.__states[self.__front]
+
+    def publish(self):
+        back = 1 - self.__front
+        state = self.__states[back]
+        record = self.track.last()
+        for name in TIMED_DTYPE.names:
+            state[name] = record[name]
+        state['Om'], state['wm'], state['xm'], state['vm'] = self.scheduler.measured
+        self.__front = back
+        self.version += 1
+
+    def run(self):
+        while self.__alive:
+            self.__receive(not self.running)
+            if self.running:
+                self.__frame()
+
+    def __receive(self, block):
+        try:
+            message = self.messages.get(block, 0.1)
+            while True:
+                self.__handle(*message)
+                message = self.messages.get_nowait()
+        except Empty:
+            pass
+
+    def __handle(self, name, *args):
+        if name == 'start':
+            self.running = True
+            self.clock_start = clock()
+            self.t_start = self.t
+        elif name == 'stop':
+            self.running = False
+        elif name == 'step':
+            if not self.running:
+                self.advance(1)
+        elif name == 'quit':
+            self.running = False
+            self.__alive = False
+            self.__handle('record', None)
+        elif name == 'reset':
+            O, w, x, v, F = args
+            self.ip.set_state(O, w, x, v)
+            self.scheduler.reset(F)
+            self.t = 0.
+            with self.lock:
+                self.resets += 1
+                self.track.clear()
+                self.track.append((self.t,) + self.ip.get_state() + (F,))
+        elif name == 'speed':
+            self.speed, self.steps_per_frame = args
+        elif name == 'norm':
+            self.pc.set_norm(args[0])
+            self.__update_error()
+        elif name == 'defuzzy':
+            self.pc.set_defuzzy(args[0])
+            self.__update_error()
+        elif name == 'engine':
+            self.pc.set_engine(args[0])
+        elif name == 'table':
+            if args[0]:
+                self.pc.compile()
+            else:
+                self.pc.decompile()
+            self.__update_error()
+        elif name == 'ratio':
+            self.scheduler.ratio = args[0]
+            self.scheduler.reset(self.scheduler.F)
+        elif name == 'delay':
+            self.scheduler.delay = args[0]
+            self.scheduler.reset(self.scheduler.F)
+        elif name == 'profile':
+            self.scheduler.profiler = self.profiler if args[0] else None
+        elif name == 'record':
+            if self.recorder is not None:
+                self.recorder.close()
+                self.recorder = None
+            if args[0] is not None:
+                self.recorder = Recorder(args[0])
+        else:
+            raise ValueError("unknown message: %r" % (name,))
+        if len(self.track) > 0:
+            self.publish()
+
+    def __update_error(self):
+        """
+        Reports the error bound of the control surface in use. Estimating it
+        takes thousands of exact evaluations, so it is done in a thread of
+        its own, over a copy of the controller since fuzzy sets keep the
+        state of their last evaluation. ``error`` stays ``None`` meanwhile.
+        """
+        surface = self.pc.surface
+        self.error = None if surface is None else surface.error
+        if surface is None or surface.error is not None:
+            return
+        controller = to_controller(from_controller(self.pc))
+        thread = threading.Thread(target=self.__estimate_error, args=(surface, controller))
+        thread.daemon = True
+        thread.start()
+
+    def __estimate_error(self, surface, controller):
+        error = surface.error_bound(controller)
+        if self.pc.surface is surface:
+            self.error = error
+
+    def __frame(self):
+        """
+        Advances the simulation by one frame. At a multiple of real time, the
+        number of steps follows the clock; as fast as possible, a fixed number
+        of steps is run.
+        """
+        dt = self.ip.dt
+        if self.speed is None:
+            n = self.steps_per_frame
+        else:
+            now = clock()
+            behind = (now - self.clock_start) * self.speed - (self.t - self.t_start)
+            if behind > self.max_lag * self.speed:
+                # Too slow to keep up: drop the backlog instead of spiraling
+                self.clock_start = now
+                self.t_start = self.t
+                behind = self.steps_per_frame * dt
+            n = int(behind / dt)
+            if n == 0:
+                time.sleep(min(self.frame_time, dt / self.speed))
+                return
+        self.advance(n)
+        self.publish()
+
+    def advance(self, n):
+        """
+        Advances the simulation by ``n`` physics steps.
+        """
+        scheduler = self.scheduler
+        ip = self.ip
+        dt = ip.dt
+        batch = empty(n, dtype=TIMED_DTYPE)
+        for i in range(n):
+            _, _, _, _, F = scheduler.step()
+            # The track keeps each state with the force that led to it
+            self.t += dt
+            batch[i] = (self.t,) + ip.get_state() + (F,)
+        with self.lock:
+            self.track.extend(batch)
+        if self.recorder is not None:
+            self.recorder.extend(batch, self.pc.__AND__, self.pc.defuzzy)